@@ -1,10 +1,13 @@
+# Green threads for Flask-SocketIO; must run before anything else imports socket/threading
+import eventlet
+eventlet.monkey_patch()
+
 from flask import Flask
 from flask_pymongo import PyMongo
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-# from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask_socketio import SocketIO
 from flask_uploads import UploadSet, configure_uploads, IMAGES, UploadNotAllowed
-from flask_jwt_extended import get_jwt_identity
 
 
 
@@ -32,16 +35,65 @@ mongo = PyMongo(app)
 # Attach mongo to app
 app.mongo = mongo
 
+# Shared change versions, the in-process category cache and the permission cache
+from services.versions import VersionTracker
+from services.category_cache import CategoryCache
+from services.permissions import PermissionCache
+VersionTracker(app)
+CategoryCache(app)
+PermissionCache(app)
+
+# Optional in-memory products mirror fed by a change stream (PRODUCT_MIRROR_ENABLED)
+from services.product_mirror import ProductMirror
+ProductMirror(app)
+
+# In-process product name index for /products/suggest
+from services.product_suggest import ProductSuggester
+ProductSuggester(app)
+
+# Index registry: 'flask ensure-indexes' / 'flask check-indexes', or MONGO_ENSURE_INDEXES at startup
+from services import indexes
+indexes.init_app(app)
+
+# 'flask backfill-conversations' for messages written before conversation summaries,
+# 'flask backfill-unread-counters' to seed the unread counters from existing messages
+from services import conversations
+conversations.init_app(app)
+
+# Message retention: 'flask archive-messages' (cron) or every MESSAGE_ARCHIVE_INTERVAL seconds;
+# 'flask backfill-deleted-at' once, so messages deleted before deleted_at existed expire too
+from services import retention
+retention.init_app(app)
+
+# Schema migrations: 'flask migrate-inventory-attributes'
+from services import migrations
+migrations.init_app(app)
+
+# Admin dashboard counters: 'flask reconcile-counters' or every COUNTER_RECONCILE_INTERVAL seconds
+from services import counters
+counters.init_app(app)
+
 # Initialize JWT for token authentication
 jwt = JWTManager(app)
 
-# Initialize SocketIO
-# socketio = SocketIO(app, cors_allowed_origins="*")
+# Initialize SocketIO (set SOCKETIO_MESSAGE_QUEUE, e.g. redis://..., to fan events out across workers)
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="http://localhost:3000",
+    async_mode=app.config.get('SOCKETIO_ASYNC_MODE', 'eventlet'),
+    message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE')
+)
+app.socketio = socketio
 # Configure image uploading via Flask-Uploads
 images = UploadSet('images', IMAGES)
 configure_uploads(app, images)
 app.images = images  # Attach the UploadSet to the app instance
 
+# Content-addressed, deduplicating image store used by the product routes
+# (IMAGE_STORAGE = 'local' for UPLOADED_IMAGES_DEST or 'gridfs' to share images across nodes)
+from services.image_store import create_image_store
+create_image_store(app)
+
 
 
 
@@ -55,6 +107,7 @@ from routes.orders import orders_bp
 from routes.inventory import inventory_bp
 from routes.chat_messages import messages_bp
 from routes.user_chat import user_chat_bp
+from routes.images import images_bp
 app.register_blueprint(auth_bp)
 app.register_blueprint(admin_bp)
 app.register_blueprint(products_bp)      # Register the products blueprint
@@ -64,58 +117,13 @@ app.register_blueprint(orders_bp)        # Register the orders blueprint
 app.register_blueprint(inventory_bp)     # Register the inventory blueprint
 app.register_blueprint(messages_bp, url_prefix='/messages')
 app.register_blueprint(user_chat_bp, url_prefix='/users')
+app.register_blueprint(images_bp)        # Serves /uploads/images/<file>
 
 
 # Live chat support backend
-# clients = {}
-
-# @socketio.on('connect')
-# def handle_connect():
-#     emit('connected', {'data': 'Connected to the server'})
-
-# @socketio.on('join')
-# def handle_join(data):
-#     room = data.get('room')
-#     join_room(room)
-#     emit('room_joined', {'message': f'Joined room {room}'}, room=room)
-
-# @socketio.on('send_message')
-# def handle_message(data):
-#     room = data.get('room')
-#     message = data.get('message')
-#     emit('receive_message', {'message': message, 'sender': 'user'}, room=room)
-
-# @socketio.on('admin_message')
-# def handle_admin_message(data):
-#     room = data.get('room')
-#     message = data.get('message')
-#     emit('receive_message', {'message': message, 'sender': 'admin'}, room=room)
-
-
-# # User initiates chat
-# @socketio.on('initiate_chat')
-# def handle_initiate_chat(data):
-#     user_id = get_jwt_identity()  # Assuming you are using JWT for authentication
-#     issue = data.get('issue')
-    
-#     # Notify admins about the incoming chat request
-#     emit('support_request', {'user_id': user_id, 'issue': issue}, broadcast=True, room='admin')
-
-# # Admin accepts chat
-# @socketio.on('accept_chat')
-# def handle_accept_chat(data):
-#     user_id = data.get('user_id')
-    
-#     # Notify user that the admin accepted the chat
-#     emit('chat_accepted', {'admin_id': get_jwt_identity()}, room=user_id)
-    
-#     # Join the room for real-time communication
-#     join_room(user_id)    
+from routes.live_chat import register_socket_handlers
+register_socket_handlers(socketio)
 
 # Start the Flask application with SocketIO
-# if __name__ == '__main__':
-#     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
-
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
-
+    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
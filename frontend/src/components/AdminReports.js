@@ -5,26 +5,48 @@ import '../css/AdminReports.css'; // Import the CSS file
 
 const AdminReports = () => {
     const [reports, setReports] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [filters, setFilters] = useState({ status: '', user: '', q: '' });
     const [selectedReportId, setSelectedReportId] = useState(null); // Track selected report
     const [error, setError] = useState('');
 
+    // Filtering, search and paging all happen on the server; 'after' continues from the last page
+    const fetchReports = async (after = null) => {
+        try {
+            const token = localStorage.getItem('token');
+            const params = {};
+            Object.entries(filters).forEach(([key, value]) => {
+                if (value) params[key] = value;
+            });
+            if (after) params.after = after;
+            const response = await axios.get('http://localhost:5000/admin/reports', {
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                },
+                params,
+            });
+            setReports(previous => after ? [...previous, ...response.data.reports] : response.data.reports);
+            setNextCursor(response.data.next_cursor);
+            setError('');
+        } catch (error) {
+            console.error('Error fetching reports:', error);
+            setError('Failed to fetch reports.');
+        }
+    };
+
     useEffect(() => {
-        const fetchReports = async () => {
-            try {
-                const token = localStorage.getItem('token');
-                const response = await axios.get('http://localhost:5000/admin/reports', {
-                    headers: {
-                        'Authorization': `Bearer ${token}`,
-                    },
-                });
-                setReports(response.data);
-            } catch (error) {
-                console.error('Error fetching reports:', error);
-                setError('Failed to fetch reports.');
-            }
-        };
         fetchReports();
-    }, []);
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [filters.status]);
+
+    const handleFilterChange = (e) => {
+        setFilters({ ...filters, [e.target.name]: e.target.value });
+    };
+
+    const handleSearch = (e) => {
+        e.preventDefault();
+        fetchReports();
+    };
 
     const handleCloseDrawer = () => {
         setSelectedReportId(null);
@@ -34,6 +56,17 @@ const AdminReports = () => {
         <div className="admin-reports">
             <h2>User Reports</h2>
             {error && <p className="error-message">{error}</p>}
+            <form className="reports-filters" onSubmit={handleSearch}>
+                <select name="status" value={filters.status} onChange={handleFilterChange}>
+                    <option value="">All statuses</option>
+                    <option value="unread">Unread</option>
+                    <option value="read">Read</option>
+                    <option value="replied">Replied</option>
+                </select>
+                <input name="user" placeholder="User email" value={filters.user} onChange={handleFilterChange} />
+                <input name="q" placeholder="Search subject or message" value={filters.q} onChange={handleFilterChange} />
+                <button type="submit" className="view-button">Search</button>
+            </form>
             {reports.length === 0 ? (
                 <p className="no-reports-message">No reports submitted.</p>
             ) : (
@@ -67,6 +100,11 @@ const AdminReports = () => {
                             ))}
                         </tbody>
                     </table>
+                    {nextCursor && (
+                        <button className="view-button" onClick={() => fetchReports(nextCursor)}>
+                            Load more
+                        </button>
+                    )}
 
                     {/* Sliding Drawer for Report Details */}
                     <div className={`drawer ${selectedReportId ? 'open' : ''}`}>
@@ -1,9 +1,9 @@
 // src/components/AdminSupportPanel.js
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useMemo } from 'react';
 import io from 'socket.io-client';
 import '../css/AdminSupportPanel.css';
 
-const SOCKET_SERVER_URL = 'http://localhost:3000'; // Adjust the URL if needed
+const SOCKET_SERVER_URL = 'http://localhost:5000'; // Flask-SocketIO server
 
 const AdminSupportPanel = () => {
     const [chatRequests, setChatRequests] = useState([]); // To hold incoming chat requests
@@ -11,7 +11,11 @@ const AdminSupportPanel = () => {
     const [messages, setMessages] = useState([]);          // To store the chat messages
     const [message, setMessage] = useState('');            // Current message to send
 
-    const socket = io(SOCKET_SERVER_URL, { withCredentials: true });
+    // Authenticate the connection with the same JWT as the REST API
+    const socket = useMemo(
+        () => io(SOCKET_SERVER_URL, { withCredentials: true, auth: { token: localStorage.getItem('token') } }),
+        []
+    );
 
     useEffect(() => {
         // Listen for chat requests
@@ -1,8 +1,36 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, BarChart, Bar } from 'recharts';
 import '../css/Dashboard.css'; // Import CSS
 
 const Dashboard = () => {
+    const [summary, setSummary] = useState(null);
+
+    // Totals come from the counters document kept by the server, one request for the whole overview
+    useEffect(() => {
+        const fetchSummary = async () => {
+            try {
+                const token = localStorage.getItem('token');
+                const response = await axios.get('http://localhost:5000/admin/summary', {
+                    headers: { Authorization: `Bearer ${token}` }
+                });
+                setSummary(response.data);
+            } catch (error) {
+                console.error('Error fetching summary:', error);
+            }
+        };
+
+        fetchSummary();
+    }, []);
+
+    const cards = summary ? [
+        { label: 'Users', value: summary.users?.total || 0 },
+        { label: 'Products', value: summary.products?.total || 0 },
+        { label: 'Low Stock', value: summary.products?.low_stock || 0 },
+        { label: 'Pending Orders', value: summary.orders?.by_status?.pending || 0 },
+        { label: 'Unread Reports', value: summary.reports?.by_status?.unread || 0 },
+    ] : [];
+
     // Example data for the charts
     const data = [
         { name: 'Jan', sales: 4000, users: 2400 },
@@ -18,6 +46,16 @@ const Dashboard = () => {
         <div className="dashboard-container">
             <h2>Dashboard Overview</h2>
 
+            {/* Summary Cards */}
+            <div className="summary-cards">
+                {cards.map(card => (
+                    <div key={card.label} className="summary-card">
+                        <span className="summary-value">{card.value}</span>
+                        <span className="summary-label">{card.label}</span>
+                    </div>
+                ))}
+            </div>
+
             {/* Line Chart */}
             <div className="chart-container">
                 <h3>Monthly Sales and Users</h3>
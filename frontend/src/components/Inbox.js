@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import axios from 'axios';
+import io from 'socket.io-client';
 import '../css/Inbox.css';  // Correct path to the separate CSS file
 
 const Inbox = () => {
@@ -9,15 +10,29 @@ const Inbox = () => {
     const [editMessage, setEditMessage] = useState('');
     const [activeTab, setActiveTab] = useState('inbox');
 
-    const fetchMessages = async () => {
-        try {
-            const token = localStorage.getItem('token');
-            const response = await axios.get('http://localhost:5000/messages/inbox', {
+    // Page through a delta-sync listing from the beginning (a full load drops deletion tombstones)
+    const fetchAllPages = async (url) => {
+        const token = localStorage.getItem('token');
+        let loaded = [];
+        let cursor = null;
+        let hasMore = true;
+        while (hasMore) {
+            const response = await axios.get(url, {
                 headers: {
                     'Authorization': `Bearer ${token}`
-                }
+                },
+                params: { limit: 200, ...(cursor ? { after: cursor } : {}) }
             });
-            setMessages(response.data);
+            loaded = loaded.concat(response.data.messages);
+            cursor = response.data.next_cursor;
+            hasMore = response.data.has_more;
+        }
+        return loaded.filter(message => !message.deleted);
+    };
+
+    const fetchMessages = async () => {
+        try {
+            setMessages(await fetchAllPages('http://localhost:5000/messages/inbox'));
         } catch (error) {
             console.error('Error fetching messages', error);
         }
@@ -25,13 +40,7 @@ const Inbox = () => {
 
     const fetchSentMessages = async () => {
         try {
-            const token = localStorage.getItem('token');
-            const response = await axios.get('http://localhost:5000/messages/sent', {
-                headers: {
-                    'Authorization': `Bearer ${token}`
-                }
-            });
-            setSentMessages(response.data);
+            setSentMessages(await fetchAllPages('http://localhost:5000/messages/sent'));
         } catch (error) {
             console.error('Error fetching sent messages', error);
         }
@@ -40,6 +49,13 @@ const Inbox = () => {
     useEffect(() => {
         fetchMessages();
         fetchSentMessages();
+
+        // New messages are pushed over Socket.IO instead of re-fetching the inbox
+        const socket = io('http://localhost:5000', { auth: { token: localStorage.getItem('token') } });
+        socket.on('new_message', (message) => {
+            setMessages(prevMessages => [...prevMessages, message]);
+        });
+        return () => socket.disconnect();
     }, []);
 
     const handleEditMessage = async (id) => {
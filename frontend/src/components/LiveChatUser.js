@@ -3,7 +3,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import io from 'socket.io-client';
 import '../css/LiveChatUser.css';
 
-const SOCKET_SERVER_URL = 'http://localhost:3000'; // Adjust as needed
+const SOCKET_SERVER_URL = 'http://localhost:5000'; // Flask-SocketIO server
 
 const LiveChatUser = () => {
     const [isOpen, setIsOpen] = useState(false);
@@ -13,11 +13,12 @@ const LiveChatUser = () => {
     const messagesEndRef = useRef(null);
 
     useEffect(() => {
-        const newSocket = io(SOCKET_SERVER_URL);
+        // Authenticate the connection with the same JWT as the REST API
+        const newSocket = io(SOCKET_SERVER_URL, { auth: { token: localStorage.getItem('token') } });
         setSocket(newSocket);
 
-        // Join the chat room
-        newSocket.emit('join', { room: 'support' });
+        // Ask for support; admins are notified and join this user's support room
+        newSocket.emit('initiate_chat', { issue: 'Live support request' });
 
         // Listen for messages
         newSocket.on('receive_message', (data) => {
@@ -36,7 +37,6 @@ const LiveChatUser = () => {
         if (!inputMessage.trim()) return;
 
         const messageData = {
-            room: 'support',
             message: inputMessage,
         };
 
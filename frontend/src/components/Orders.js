@@ -6,12 +6,14 @@ const Orders = () => {
   const [receivedOrders, setReceivedOrders] = useState([]);
   const [activeTab, setActiveTab] = useState('pending');
   const [products, setProducts] = useState([]);
+  const [lowStock, setLowStock] = useState([]);
   const [selectedProduct, setSelectedProduct] = useState('');
   const [orderQuantity, setOrderQuantity] = useState('');
 
   useEffect(() => {
     fetchOrders();
     fetchProducts();
+    fetchLowStock();
   }, []);
   
   useEffect(() => {
@@ -19,19 +21,91 @@ const Orders = () => {
     console.log('Received Orders:', receivedOrders);
   }, [orders, receivedOrders]);
   
-  const fetchOrders = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/admin/orders', {
+  // Follow the server's cursor until every page of an orders listing is loaded
+  const fetchAllPages = async (url, params = {}) => {
+    let loaded = [];
+    let cursor = null;
+    do {
+      const query = new URLSearchParams({ ...params, limit: '200', ...(cursor ? { after: cursor } : {}) });
+      const response = await fetch(`${url}?${query}`, {
         method: 'GET',
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`,
         },
       });
       const data = await response.json();
-  
-      // Separate pending and received orders
-      setOrders(data.filter(order => order.status === 'pending'));
-      setReceivedOrders(data.filter(order => order.status === 'received'));
+      loaded = loaded.concat(data.orders);
+      cursor = data.next_cursor;
+    } while (cursor);
+    return loaded;
+  };
+
+  // Products below their minimum quantity, flagged by the server
+  const fetchLowStock = async () => {
+    try {
+      let loaded = [];
+      let cursor = null;
+      do {
+        const query = new URLSearchParams({ limit: '200', ...(cursor ? { after: cursor } : {}) });
+        const response = await fetch(`http://localhost:5000/admin/low_stock?${query}`, {
+          method: 'GET',
+          headers: {
+            'Authorization': `Bearer ${localStorage.getItem('token')}`,
+          },
+        });
+        const data = await response.json();
+        loaded = loaded.concat(data.products);
+        cursor = data.next_cursor;
+      } while (cursor);
+      setLowStock(loaded);
+    } catch (error) {
+      console.error('Error fetching low stock:', error);
+    }
+  };
+
+  // Prefill the order form with a low-stock product and its shortfall
+  const handleReorder = (item) => {
+    setSelectedProduct(item.id);
+    setOrderQuantity(String(item.shortfall));
+  };
+
+  // Preview the generated reorders, then place them all in one request
+  const handleReorderAll = async () => {
+    const request = (dryRun) => fetch('http://localhost:5000/admin/orders/reorder', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${localStorage.getItem('token')}`,
+      },
+      body: JSON.stringify({ dry_run: dryRun }),
+    }).then(response => response.json());
+
+    try {
+      const preview = await request(true);
+      if (!preview.orders || preview.orders.length === 0) {
+        alert('Nothing to reorder: every low-stock product already has a pending order.');
+        return;
+      }
+      const lines = preview.orders.map(order => `${order.name}: ${order.order_quantity}`).join('\n');
+      if (!window.confirm(`Place these orders?\n\n${lines}`)) return;
+
+      const result = await request(false);
+      alert(result.message);
+      fetchOrders();
+      fetchLowStock();
+    } catch (error) {
+      console.error('Error generating reorders:', error);
+    }
+  };
+
+  const fetchOrders = async () => {
+    try {
+      const [pending, received] = await Promise.all([
+        fetchAllPages('http://localhost:5000/admin/orders/pending'),
+        fetchAllPages('http://localhost:5000/admin/orders', { status: 'received' }),
+      ]);
+      setOrders(pending);
+      setReceivedOrders(received);
     } catch (error) {
       console.error('Error fetching orders:', error);
     }
@@ -99,6 +173,7 @@ const Orders = () => {
       const data = await response.json();
       if (response.ok) {
         alert(data.message);
+        fetchLowStock();
   
         // Move the order from "orders" to "receivedOrders" immediately
         const receivedOrder = orders.find(order => order.id === orderId);
@@ -168,9 +243,51 @@ const Orders = () => {
         >
           Received Orders
         </button>
+        <button
+          className={activeTab === 'low_stock' ? 'active' : ''}
+          onClick={() => setActiveTab('low_stock')}
+        >
+          Low Stock ({lowStock.length})
+        </button>
       </div>
 
-      {activeTab === 'pending' ? (
+      {activeTab === 'low_stock' ? (
+        <div className="orders-list">
+          {lowStock.length === 0 ? (
+            <p>No products below their minimum quantity.</p>
+          ) : (
+            <>
+            <button onClick={handleReorderAll} className="place-order-btn">Reorder All</button>
+            <table className="orders-table">
+              <thead>
+                <tr>
+                  <th>Product</th>
+                  <th>Quantity</th>
+                  <th>Minimum</th>
+                  <th>Shortfall</th>
+                  <th>Action</th>
+                </tr>
+              </thead>
+              <tbody>
+                {lowStock.map(item => (
+                  <tr key={item.id}>
+                    <td>{item.name}</td>
+                    <td>{item.quantity}</td>
+                    <td>{item.min_quantity}</td>
+                    <td>{item.shortfall}</td>
+                    <td>
+                      <button onClick={() => handleReorder(item)} className="receive-btn">
+                        Reorder
+                      </button>
+                    </td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+            </>
+          )}
+        </div>
+      ) : activeTab === 'pending' ? (
         <div className="orders-list">
           {orders.length === 0 ? (
             <p>No pending orders available.</p>
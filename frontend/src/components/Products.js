@@ -11,6 +11,8 @@ const Products = () => {
     const [categories, setCategories] = useState([]);
     const [error, setError] = useState('');
     const [successMessage, setSuccessMessage] = useState('');
+    const [searchQuery, setSearchQuery] = useState('');
+    const [suggestions, setSuggestions] = useState([]);
 
     // States for adding a new product
     const [newProduct, setNewProduct] = useState({
@@ -38,13 +40,54 @@ const Products = () => {
 
     const fetchProducts = async () => {
         try {
-            const response = await axios.get('http://localhost:5000/products');
-            setProducts(response.data);
+            // Stream the catalog page by page, following the server's cursor
+            let loaded = [];
+            let cursor = null;
+            do {
+                const response = await axios.get('http://localhost:5000/products', {
+                    params: { limit: 200, ...(cursor ? { after: cursor } : {}) },
+                });
+                loaded = loaded.concat(response.data.products);
+                setProducts(loaded);
+                cursor = response.data.next_cursor;
+            } while (cursor);
         } catch (error) {
             setError('Failed to fetch products');
         }
     };
 
+    // Autocomplete product names as the user types
+    const handleSearchInput = async (value) => {
+        setSearchQuery(value);
+        if (!value.trim()) {
+            setSuggestions([]);
+            return;
+        }
+        try {
+            const response = await axios.get('http://localhost:5000/products/suggest', { params: { q: value } });
+            setSuggestions(response.data.suggestions);
+        } catch (error) {
+            setSuggestions([]);
+        }
+    };
+
+    // Show the best keyword matches instead of the full catalog (an empty query restores it)
+    const handleSearch = async (e) => {
+        e.preventDefault();
+        if (!searchQuery.trim()) {
+            fetchProducts();
+            return;
+        }
+        try {
+            const response = await axios.get('http://localhost:5000/products/search', {
+                params: { q: searchQuery, limit: 100 },
+            });
+            setProducts(response.data.products);
+        } catch (error) {
+            setError('Failed to search products');
+        }
+    };
+
     const fetchCategories = async () => {
         try {
             const response = await axios.get('http://localhost:5000/categories');
@@ -304,6 +347,21 @@ const Products = () => {
 
             {/* Product List */}
             <h3>Product List</h3>
+            <form onSubmit={handleSearch} className="product-search">
+                <input
+                    type="text"
+                    placeholder="Search products"
+                    list="product-suggestions"
+                    value={searchQuery}
+                    onChange={(e) => handleSearchInput(e.target.value)}
+                />
+                <datalist id="product-suggestions">
+                    {suggestions.map((suggestion) => (
+                        <option key={suggestion.id} value={suggestion.name} />
+                    ))}
+                </datalist>
+                <button type="submit">Search</button>
+            </form>
             <table className="product-table">
                 <thead>
                     <tr>
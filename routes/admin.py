@@ -5,6 +5,11 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
 import logging
 
+from services.streaming import wants_stream, stream_ndjson
+from services.conditional import versioned
+from services import counters
+from services.product_schema import to_number, BELOW_MIN_STAGE
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -24,7 +29,39 @@ def is_valid_objectid(id_str):
 
     
 
+# Helper function to shape a user for the admin listing
+def serialize_user(user):
+    return {
+        'id': str(user['_id']),
+        'email': user['email'],
+        'role': user['role'],
+        'permissions': user.get('permissions', {}),
+        'registration_time': user.get('registration_time'),
+        'last_seen': user.get('last_seen'),
+        'online_duration': user.get('online_duration', 0)
+    }
+
+# Route to fetch the dashboard totals (admin only)
+# Served from the counters document maintained by the write routes, not by counting collections
+@admin_bp.route('/admin/summary', methods=['GET'])
+@jwt_required()
+def get_summary():
+    try:
+        current_user = get_jwt_identity()
+
+        if current_user['role'] != 'admin':
+            return jsonify({'message': 'Access forbidden'}), 403
+
+        summary = counters.summary(current_app.mongo.db)
+        summary.pop('_id', None)
+        return jsonify(summary), 200
+
+    except Exception as e:
+        logging.error(f"Error fetching dashboard summary: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
 # Route to fetch all users (admin only)
+# Pass ?stream=1 or Accept: application/x-ndjson to stream the list as NDJSON
 @admin_bp.route('/admin/users', methods=['GET'])
 @jwt_required()
 def get_users():
@@ -42,19 +79,10 @@ def get_users():
 
         # Fetch all users, excluding their passwords
         users_cursor = mongo.db.users.find({}, {'password': 0})  # Exclude password for security reasons
-        user_list = []
-        for user in users_cursor:
-            user_info = {
-                'id': str(user['_id']),
-                'email': user['email'],
-                'role': user['role'],
-                'permissions': user.get('permissions', {}),
-                'registration_time': user.get('registration_time'),
-                'last_seen': user.get('last_seen'),
-                'online_duration': user.get('online_duration', 0)
-            }
-            user_list.append(user_info)
+        if wants_stream():
+            return stream_ndjson(users_cursor, serialize_user)
 
+        user_list = [serialize_user(user) for user in users_cursor]
         return jsonify(user_list), 200
 
     except Exception as e:
@@ -89,6 +117,9 @@ def update_user_permissions(user_id):
         if result.matched_count == 0:
             return jsonify({'message': 'User not found'}), 404
 
+        # Revoke the permission claims carried by already issued tokens
+        current_app.permission_cache.invalidate()
+
         return jsonify({'message': 'Permissions updated successfully'}), 200
 
     except Exception as e:
@@ -115,9 +146,11 @@ def delete_user(user_id):
         mongo = current_app.mongo
 
         # Find and delete the user by ID
-        result = mongo.db.users.delete_one({'_id': ObjectId(user_id)})
+        deleted = mongo.db.users.find_one_and_delete({'_id': ObjectId(user_id)}, {'role': 1})
 
-        if result.deleted_count == 1:
+        if deleted:
+            counters.increment(mongo.db, {'users.total': -1, counters.key('users', deleted.get('role', 'user')): -1})
+            current_app.permission_cache.invalidate()
             logging.info(f"User {user_id} deleted successfully")
             return jsonify({'message': f'User deleted successfully'}), 200
         else:
@@ -130,18 +163,11 @@ def delete_user(user_id):
 
 # Route to get all categories (open to everyone)
 @admin_bp.route('/categories', methods=['GET'])
+@versioned('categories')
 def get_categories():
     try:
-        logging.info("Accessing /categories endpoint")
-
-        # Access MongoDB via current_app
-        mongo = current_app.mongo
-
-        # Fetch all categories
-        categories = mongo.db.categories.find()
-        category_list = [category['name'] for category in categories]
-
-        logging.info(f"Fetched categories: {category_list}")
+        # Served from the in-process category cache
+        category_list = current_app.category_cache.names()
 
         return jsonify(category_list), 200
 
@@ -187,6 +213,7 @@ def add_category():
 
         # Insert the new category into MongoDB
         mongo.db.categories.insert_one({'name': category_name})
+        current_app.category_cache.invalidate()
         logging.info(f"Category {category_name} added successfully")
 
         return jsonify({'message': 'Category added successfully'}), 201
@@ -216,6 +243,7 @@ def delete_category(category_name):
         result = mongo.db.categories.delete_one({'name': category_name})
 
         if result.deleted_count == 1:
+            current_app.category_cache.invalidate()
             logging.info(f"Category {category_name} deleted successfully")
             return jsonify({'message': 'Category deleted successfully'}), 200
         else:
@@ -226,7 +254,21 @@ def delete_category(category_name):
         logging.error(f"Error deleting category: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
+# Helper function to shape a product for the admin listing
+def serialize_admin_product(product):
+    return {
+        'id': str(product['_id']),
+        'name': product['name'],
+        'category': product['category'],
+        'attributes': product.get('attributes', {}),
+        'description': product.get('description', ''),
+        'added_by': product.get('added_by'),
+        'created_at': product.get('created_at'),
+        'updated_at': product.get('updated_at')
+    }
+
 # Route to get all products (admin only)
+# Pass ?stream=1 or Accept: application/x-ndjson to stream the list as NDJSON
 @admin_bp.route('/admin/products', methods=['GET'])
 @jwt_required()
 def get_all_products():
@@ -238,21 +280,17 @@ def get_all_products():
         # Access MongoDB
         mongo = current_app.mongo
 
+        # Serve from the in-memory mirror when it is loaded
+        mirror = current_app.product_mirror
+        if mirror.fresh() and not wants_stream():
+            return jsonify([serialize_admin_product(product) for product in mirror.all()]), 200
+
         # Fetch all products
         products_cursor = mongo.db.products.find()
-        products = []
-        for product in products_cursor:
-            products.append({
-                'id': str(product['_id']),
-                'name': product['name'],
-                'category': product['category'],
-                'attributes': product.get('attributes', {}),
-                'description': product.get('description', ''),
-                'added_by': product.get('added_by'),
-                'created_at': product.get('created_at'),
-                'updated_at': product.get('updated_at')
-            })
+        if wants_stream():
+            return stream_ndjson(products_cursor, serialize_admin_product)
 
+        products = [serialize_admin_product(product) for product in products_cursor]
         return jsonify(products), 200
 
     except Exception as e:
@@ -300,20 +338,25 @@ def update_min_quantity(product_id):
             return jsonify({'message': 'Access forbidden'}), 403
 
         data = request.get_json()
-        new_min_quantity = data.get('min_quantity')
-
-        if new_min_quantity is None or new_min_quantity < 0:
+        try:
+            new_min_quantity = to_number(data.get('min_quantity'), int)
+        except ValueError:
             return jsonify({'message': 'Invalid minimum quantity'}), 400
 
+        # The minimum lives in attributes next to the quantity it is compared with
         mongo = current_app.mongo
-        result = mongo.db.products.update_one(
+        before = mongo.db.products.find_one_and_update(
             {'_id': ObjectId(product_id)},
-            {'$set': {'min_quantity': new_min_quantity}}
+            [{'$set': {'attributes.min_quantity': new_min_quantity}}, {'$unset': 'min_quantity'}, BELOW_MIN_STAGE],
+            projection={'attributes.quantity': 1, 'attributes.min_quantity': 1, 'min_quantity': 1}
         )
 
-        if result.matched_count == 0:
+        if before is None:
             return jsonify({'message': 'Product not found'}), 404
 
+        after = {'attributes': dict(before.get('attributes') or {}, min_quantity=new_min_quantity)}
+        counters.increment(mongo.db, {'products.low_stock': counters.low_stock_change(before, after)})
+        current_app.versions.bump('products')
         return jsonify({'message': 'Minimum quantity updated successfully'}), 200
 
     except Exception as e:
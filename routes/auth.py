@@ -7,6 +7,8 @@ from flask_cors import cross_origin
 import logging
 from datetime import datetime
 
+from services import counters
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -48,6 +50,7 @@ def register():
             'last_seen': datetime.utcnow(),          # Initial last seen time set at registration
             'online_duration': 0                     # Initial duration is 0
         })
+        counters.increment(mongo.db, {'users.total': 1, counters.key('users', user_role): 1})
         logging.info(f"User {data['email']} registered successfully")
         return jsonify({'message': 'User registered successfully'}), 201
     except Exception as e:
@@ -70,6 +73,9 @@ def login():
     # Access MongoDB via current_app
     mongo = current_app.mongo
 
+    # Read the permissions version before the user, so a concurrent change is never masked
+    permissions_version = current_app.permission_cache.current_version()
+
     # Find the user by email
     user = mongo.db.users.find_one({'email': data['email']})
 
@@ -78,7 +84,9 @@ def login():
         access_token = create_access_token(identity={
         'id': str(user['_id']),
         'email': user['email'],
-        'role': user['role']
+        'role': user['role'],
+        'permissions': user.get('permissions', {}),
+        'permissions_version': permissions_version
     })
         # Update last seen time
         mongo.db.users.update_one(
@@ -3,8 +3,83 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
 from datetime import datetime
 
+from routes.live_chat import notify_user
+from services import conversations
+from services.pagination import (
+    parse_limit, encode_cursor, decode_cursor, keyset_filter, split_page, parse_datetime_param
+)
+
 messages_bp = Blueprint('messages', __name__)
 
+# Helper function to validate ObjectId
+def is_valid_objectid(id_str):
+    try:
+        ObjectId(id_str)
+        return True
+    except:
+        return False
+
+# Helper function to adjust a user's unread counter (one document per user, keyed by user id)
+def increment_unread(mongo, user_id, amount, session=None):
+    mongo.db.message_counters.update_one(
+        {'_id': user_id},
+        {'$inc': {'unread': amount}},
+        upsert=True,
+        session=session
+    )
+
+# Helper function to run callback(session) in a transaction, retrying transient errors
+def in_transaction(mongo, callback):
+    with mongo.cx.start_session() as session:
+        return session.with_transaction(callback)
+
+# Helper function to shape a deleted message for a delta sync: only what the client needs to drop it
+def serialize_tombstone(message):
+    return {
+        'id': str(message['_id']),
+        'deleted': True,
+        'updated_at': message['updated_at']
+    }
+
+# Delta sync over the messages matching query, ordered by (updated_at, _id).
+# Every write to a message (send, edit, delete, seen) moves its updated_at, so a sync returns
+# new messages and changes to ones the client already has; deleted messages come back as
+# tombstones until the TTL index purges them.
+# Query parameters: since (ISO timestamp) or after (cursor from a previous sync), limit.
+# The response always carries next_cursor, so a client can store it and later ask only
+# for what changed since; has_more tells it to keep paging right away.
+def sync_messages(query, serialize):
+    query = dict(query)
+    after = request.args.get('after')
+    try:
+        if after:
+            query.update(keyset_filter('updated_at', decode_cursor(after)))
+        else:
+            since = parse_datetime_param(request.args.get('since'))
+            if since:
+                query['updated_at'] = {'$gt': since}
+    except ValueError:
+        return jsonify({'message': 'Invalid cursor or since value'}), 400
+
+    limit = parse_limit(request.args.get('limit'))
+    mongo = current_app.mongo
+    messages = list(mongo.db.messages.find(query).sort([('updated_at', 1), ('_id', 1)]).limit(limit + 1))
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    if messages:
+        next_cursor = encode_cursor(messages[-1]['updated_at'], messages[-1]['_id'])
+    else:
+        next_cursor = after
+    return jsonify({
+        'messages': [
+            serialize_tombstone(message) if message.get('deleted', False) else serialize(message)
+            for message in messages
+        ],
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }), 200
+
 # Send a message
 @messages_bp.route('/send', methods=['POST'])
 @jwt_required()
@@ -24,38 +99,93 @@ def send_message():
         return jsonify({'message': 'Receiver not found'}), 404
 
     # Save the message in the database
+    now = datetime.utcnow()
     message = {
         'sender_id': current_user['id'],
         'sender_email': current_user['email'],
         'receiver_id': str(receiver['_id']),
         'receiver_email': receiver_email,
+        'pair': conversations.pair_key(current_user['id'], str(receiver['_id'])),
         'message': message_text,
         'seen': False,
         'edited': False,
         'deleted': False,
-        'timestamp': datetime.utcnow()
+        'timestamp': now,
+        'updated_at': now
     }
-    mongo.db.messages.insert_one(message)
+
+    # The message, the conversation summary and the unread counter change together
+    def save(session):
+        result = mongo.db.messages.insert_one(message, session=session)
+        conversations.record_sent(mongo.db, message, result.inserted_id, session=session)
+        increment_unread(mongo, message['receiver_id'], 1, session=session)
+        return result
+
+    result = in_transaction(mongo, save)
+
+    # Deliver the message to the recipient's open connections in real time
+    notify_user(message['receiver_id'], 'new_message', {
+        'id': str(result.inserted_id),
+        'sender_email': message['sender_email'],
+        'message': message['message'],
+        'seen': message['seen'],
+        'edited': message['edited'],
+        'timestamp': message['timestamp'].isoformat()
+    })
     return jsonify({'message': 'Message sent successfully'}), 201
 
-# Fetch messages for the inbox
+# Helper function to shape a received message
+def serialize_inbox_message(message):
+    return {
+        'id': str(message['_id']),
+        'sender_email': message['sender_email'],
+        'message': message['message'],
+        'seen': message['seen'],
+        'edited': message['edited'],
+        'deleted': message.get('deleted', False),
+        'timestamp': message['timestamp'],
+        'updated_at': message['updated_at']
+    }
+
+# Fetch messages for the inbox (delta sync, see sync_messages)
 @messages_bp.route('/inbox', methods=['GET'])
 @jwt_required()
 def get_inbox():
+    current_user = get_jwt_identity()
+    return sync_messages({'receiver_email': current_user['email']}, serialize_inbox_message)
+
+# Unread message count for the badge: a single point read
+@messages_bp.route('/unread_count', methods=['GET'])
+@jwt_required()
+def get_unread_count():
+    current_user = get_jwt_identity()
+    mongo = current_app.mongo
+    counter = mongo.db.message_counters.find_one({'_id': current_user['id']})
+    return jsonify({'unread': counter.get('unread', 0) if counter else 0}), 200
+
+# Mark a received message as seen
+@messages_bp.route('/seen/<message_id>', methods=['PUT'])
+@jwt_required()
+def mark_message_seen(message_id):
     current_user = get_jwt_identity()
     mongo = current_app.mongo
-    messages = mongo.db.messages.find({'receiver_email': current_user['email']})
-    message_list = []
-    for message in messages:
-        message_list.append({
-            'id': str(message['_id']),
-            'sender_email': message['sender_email'],
-            'message': message['message'],
-            'seen': message['seen'],
-            'edited': message['edited'],
-            'timestamp': message['timestamp']
-        })
-    return jsonify(message_list), 200
+
+    if not is_valid_objectid(message_id):
+        return jsonify({'message': 'Invalid message ID'}), 400
+
+    def mark_seen(session):
+        message = mongo.db.messages.find_one_and_update(
+            {'_id': ObjectId(message_id), 'receiver_id': current_user['id'], 'seen': False},
+            {'$set': {'seen': True, 'updated_at': datetime.utcnow()}},
+            session=session
+        )
+        # Only the request that actually flips the flag decrements the counters
+        if message:
+            increment_unread(mongo, current_user['id'], -1, session=session)
+            conversations.record_seen(mongo.db, message, session=session)
+
+    in_transaction(mongo, mark_seen)
+    return jsonify({'message': 'Message marked as seen'}), 200
 
 
 # Edit a message
@@ -75,10 +205,15 @@ def edit_message(message_id):
     if not message or message['sender_id'] != current_user['id']:
         return jsonify({'message': 'Permission denied or message not found'}), 403
 
-    mongo.db.messages.update_one(
-        {'_id': ObjectId(message_id)},
-        {'$set': {'message': message_text, 'edited': True}}
-    )
+    def save(session):
+        mongo.db.messages.update_one(
+            {'_id': ObjectId(message_id)},
+            {'$set': {'message': message_text, 'edited': True, 'updated_at': datetime.utcnow()}},
+            session=session
+        )
+        conversations.record_text(mongo.db, message, message_text, session=session)
+
+    in_transaction(mongo, save)
     return jsonify({'message': 'Message updated successfully'}), 200
 
 # Delete a message
@@ -93,28 +228,153 @@ def delete_message(message_id):
     if not message or message['sender_id'] != current_user['id']:
         return jsonify({'message': 'Permission denied or message not found'}), 403
 
-    mongo.db.messages.update_one(
-        {'_id': ObjectId(message_id)},
-        {'$set': {'deleted': True, 'message': '[Message deleted]'}}
-    )
+    def save(session):
+        # Returns the message as it was before, so an unseen message is uncounted only once
+        now = datetime.utcnow()
+        previous = mongo.db.messages.find_one_and_update(
+            {'_id': ObjectId(message_id), 'deleted': False},
+            {'$set': {'deleted': True, 'message': '[Message deleted]', 'deleted_at': now, 'updated_at': now}},
+            session=session
+        )
+        if not previous:
+            return
+        if not previous.get('seen', False):
+            increment_unread(mongo, previous['receiver_id'], -1, session=session)
+            conversations.record_seen(mongo.db, previous, session=session)
+        conversations.record_text(mongo.db, previous, '[Message deleted]', session=session)
+
+    in_transaction(mongo, save)
     return jsonify({'message': 'Message deleted successfully'}), 200
 
 
 
-# Fetch sent messages
+# Helper function to shape a sent message
+def serialize_sent_message(message):
+    return {
+        'id': str(message['_id']),
+        'receiver_email': message['receiver_email'],
+        'message': message['message'],
+        'deleted': message.get('deleted', False),
+        'timestamp': message['timestamp'],
+        'updated_at': message['updated_at']
+    }
+
+# Fetch sent messages (delta sync, see sync_messages)
 @messages_bp.route('/sent', methods=['GET'])
 @jwt_required()
 def get_sent_messages():
+    current_user = get_jwt_identity()
+    return sync_messages({'sender_id': current_user['id']}, serialize_sent_message)
+
+
+# Helper function to shape a conversation summary for one of its participants
+def serialize_conversation(conversation, user_id):
+    peer = next((p for p in conversation['participants'] if p['id'] != user_id), conversation['participants'][0])
+    return {
+        'id': conversation['_id'],
+        'peer_id': peer['id'],
+        'peer_email': peer['email'],
+        'last_message': conversation.get('last_message', ''),
+        'last_sender_id': conversation.get('last_sender_id'),
+        'last_timestamp': conversation.get('last_timestamp'),
+        'unread': conversation.get('unread', {}).get(user_id, 0)
+    }
+
+# List the current user's conversations, most recent first
+# Query parameters: limit, after (cursor)
+@messages_bp.route('/conversations', methods=['GET'])
+@jwt_required()
+def get_conversations():
+    current_user = get_jwt_identity()
+    mongo = current_app.mongo
+
+    query = {'participant_ids': current_user['id']}
+    after = request.args.get('after')
+    if after:
+        try:
+            query.update(keyset_filter('last_timestamp', decode_cursor(after), descending=True))
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+
+    limit = parse_limit(request.args.get('limit'))
+    documents = list(mongo.db.conversations.find(query).sort([('last_timestamp', -1), ('_id', -1)]).limit(limit + 1))
+    page, next_cursor = split_page(documents, limit, ['last_timestamp', '_id'])
+    return jsonify({
+        'conversations': [serialize_conversation(conversation, current_user['id']) for conversation in page],
+        'next_cursor': next_cursor
+    }), 200
+
+# Helper function to shape a message inside a conversation
+def serialize_conversation_message(message):
+    return {
+        'id': str(message['_id']),
+        'sender_email': message['sender_email'],
+        'receiver_email': message['receiver_email'],
+        'message': message['message'],
+        'seen': message['seen'],
+        'edited': message['edited'],
+        'deleted': message.get('deleted', False),
+        'timestamp': message['timestamp']
+    }
+
+# Messages exchanged with one peer (by email), newest first
+# Query parameters: limit, after (cursor)
+@messages_bp.route('/conversations/<peer>', methods=['GET'])
+@jwt_required()
+def get_conversation(peer):
+    current_user = get_jwt_identity()
+    mongo = current_app.mongo
+
+    peer_user = mongo.db.users.find_one({'email': peer}, {'_id': 1})
+    if not peer_user:
+        return jsonify({'message': 'User not found'}), 404
+
+    query = {'pair': conversations.pair_key(current_user['id'], str(peer_user['_id']))}
+    after = request.args.get('after')
+    if after:
+        try:
+            query.update(keyset_filter('timestamp', decode_cursor(after), descending=True))
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+
+    limit = parse_limit(request.args.get('limit'))
+    documents = list(mongo.db.messages.find(query).sort([('timestamp', -1), ('_id', -1)]).limit(limit + 1))
+    page, next_cursor = split_page(documents, limit, ['timestamp', '_id'])
+    return jsonify({
+        'messages': [serialize_conversation_message(message) for message in page],
+        'next_cursor': next_cursor
+    }), 200
+
+# Archived message history (see services/retention.py), newest first
+# Query parameters: peer (email, to restrict to one conversation), limit, after (cursor)
+@messages_bp.route('/archive', methods=['GET'])
+@jwt_required()
+def get_archived_messages():
     current_user = get_jwt_identity()
     mongo = current_app.mongo
-    messages = mongo.db.messages.find({'sender_id': current_user['id'], 'deleted': {'$ne': True}})
-    message_list = []
-    for message in messages:
-        message_list.append({
-            'id': str(message['_id']),
-            'receiver_email': message['receiver_email'],
-            'message': message['message'],
-            'deleted': message.get('deleted', False),
-            'timestamp': message['timestamp']
-        })
-    return jsonify(message_list), 200
+
+    peer = request.args.get('peer')
+    if peer:
+        peer_user = mongo.db.users.find_one({'email': peer}, {'_id': 1})
+        if not peer_user:
+            return jsonify({'message': 'User not found'}), 404
+        conditions = [{'pair': conversations.pair_key(current_user['id'], str(peer_user['_id']))}]
+    else:
+        conditions = [{'$or': [{'sender_id': current_user['id']}, {'receiver_id': current_user['id']}]}]
+
+    after = request.args.get('after')
+    if after:
+        try:
+            conditions.append(keyset_filter('timestamp', decode_cursor(after), descending=True))
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+
+    limit = parse_limit(request.args.get('limit'))
+    documents = list(
+        mongo.db.messages_archive.find({'$and': conditions}).sort([('timestamp', -1), ('_id', -1)]).limit(limit + 1)
+    )
+    page, next_cursor = split_page(documents, limit, ['timestamp', '_id'])
+    return jsonify({
+        'messages': [serialize_conversation_message(message) for message in page],
+        'next_cursor': next_cursor
+    }), 200
@@ -0,0 +1,39 @@
+# routes/images.py
+
+from flask import Blueprint, current_app
+import logging
+
+from services.image_store import HASHED_FILENAME
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+
+# Blueprint setup for serving uploaded images
+images_bp = Blueprint('images', __name__)
+
+# Content-addressed images never change, so clients may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Other (legacy, non-hashed) images are revalidated after an hour
+MUTABLE_MAX_AGE = 60 * 60
+
+# Route to serve a product image (open to everyone)
+@images_bp.route('/uploads/images/<path:filename>', methods=['GET'])
+def serve_image(filename):
+    response = current_app.image_store.send(filename)
+
+    # Never let the browser guess a type other than the one we send
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    if filename.lower().endswith('.svg'):
+        # SVGs stored before they were refused may carry script: download them, never render them
+        response.headers['Content-Disposition'] = 'attachment'
+        response.headers['Content-Security-Policy'] = 'sandbox'
+
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if HASHED_FILENAME.match(filename):
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = MUTABLE_MAX_AGE
+    return response
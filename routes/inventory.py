@@ -1,9 +1,18 @@
 from flask import Blueprint, jsonify, request, current_app
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
-from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta
 import logging
 
+from services.streaming import wants_stream, stream_ndjson
+from services.conditional import versioned
+from services import counters, ledger
+from services.pagination import parse_limit, decode_cursor, keyset_filter, split_page, parse_datetime_param
+from services.product_schema import BELOW_MIN_STAGE, CURRENT_QUANTITY, to_number
+from services.attribute_query import compile_attribute_filter, parse_attribute_order, require_sort_field
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -18,104 +27,299 @@ def is_valid_objectid(id_str):
     except:
         return False
 
-# Helper function to safely convert to integer
-def safe_int(value, default=0):
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return default
+# Helper function to shape a product for the inventory check
+# Quantities, price and minimum are stored as numbers in attributes (see services/product_schema.py)
+def serialize_inventory_item(product):
+    attributes = product.get('attributes', {})
+    return {
+        'id': str(product['_id']),
+        'name': product['name'],
+        'price': attributes.get('price', 0),
+        'quantity': attributes.get('quantity', 0),
+        'previous_quantity': product.get('previous_quantity', 0),  # Previous quantity at root level
+        'used_today': product.get('used_today', 0),
+        'image': product.get('image', ''),
+        'min_quantity': attributes.get('min_quantity', 0),
+    }
 
-# Helper function to safely convert to float
-def safe_float(value, default=0.0):
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return default
+# Run a filtered inventory listing for the current request
+# Query parameters: attr.* filters, order ('attr.<key>' or '-attr.<key>', default by ID), limit, after (cursor)
+def list_inventory(attribute_filter):
+    order = request.args.get('order')
+    sort_field, descending = parse_attribute_order(order) if order else ('_id', False)
+
+    query = require_sort_field(dict(attribute_filter), sort_field)
+    after = request.args.get('after')
+    if after:
+        try:
+            query.update(keyset_filter(sort_field, decode_cursor(after), descending))
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+
+    direction = -1 if descending else 1
+    sort = [('_id', direction)] if sort_field == '_id' else [(sort_field, direction), ('_id', direction)]
+    limit = parse_limit(request.args.get('limit'))
+
+    mongo = current_app.mongo
+    documents = list(mongo.db.products.find(query).sort(sort).limit(limit + 1))
+    cursor_fields = ['_id'] if sort_field == '_id' else [sort_field, '_id']
+    page, next_cursor = split_page(documents, limit, cursor_fields)
+
+    return jsonify({
+        'products': [serialize_inventory_item(product) for product in page],
+        'next_cursor': next_cursor
+    }), 200
 
 # ============================
 # Inventory Check Route
 # ============================
-# ============================
-# Inventory Check Route
-# ============================
+# Pass ?stream=1 or Accept: application/x-ndjson to stream the list as NDJSON
+# With attr.* filters or an attribute order the result is paged instead (see list_inventory)
 @inventory_bp.route('/check_inventory', methods=['GET'])
 @jwt_required()
+@versioned('products')
 def check_inventory():
     try:
+        try:
+            attribute_filter = compile_attribute_filter(request.args)
+            order = request.args.get('order')
+            if order and parse_attribute_order(order) is None:
+                return jsonify({'message': f"Invalid order: {order}"}), 400
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        if attribute_filter or order:
+            return list_inventory(attribute_filter)
+
+        # Serve from the in-memory mirror when it is loaded
+        mirror = current_app.product_mirror
+        if mirror.fresh() and not wants_stream():
+            return jsonify([serialize_inventory_item(product) for product in mirror.all()]), 200
+
         mongo = current_app.mongo
         products_cursor = mongo.db.products.find()  # Fetch all products
-        products = []
-
-        for product in products_cursor:
-            # Fetch attributes (including price and quantity)
-            attributes = product.get('attributes', {})
-            price = safe_float(attributes.get('price', 0))  # Price is in attributes
-            current_quantity = safe_int(attributes.get('quantity', 0))  # Quantity is in attributes
-            previous_quantity = safe_int(product.get('previous_quantity', 0))  # Previous quantity at root level
-
-            # Append the product details including price, quantity, and previous_quantity
-            products.append({
-                'id': str(product['_id']),
-                'name': product['name'],
-                'price': price,
-                'quantity': current_quantity,  # Current quantity from attributes
-                'previous_quantity': previous_quantity,  # Previous quantity from root level
-                'used_today': safe_int(product.get('used_today', 0)),
-                'image': product.get('image', ''),
-                'min_quantity': safe_int(attributes.get('min_quantity', 0)),
-            })
+        if wants_stream():
+            return stream_ndjson(products_cursor, serialize_inventory_item)
 
+        products = [serialize_inventory_item(product) for product in products_cursor]
         return jsonify(products), 200
 
     except Exception as e:
         logging.error(f"Error checking inventory: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
+# ============================
+# Low Stock Route
+# ============================
+# Products whose quantity is below their minimum, read through the partial below_min index
+# Query parameters: category, limit, after (cursor)
+@inventory_bp.route('/admin/low_stock', methods=['GET'])
+@jwt_required()
+@versioned('products', roles=('admin',))
+def get_low_stock():
+    try:
+        current_user = get_jwt_identity()
+        if current_user['role'] != 'admin':
+            return jsonify({'message': 'Access forbidden'}), 403
+
+        query = {'below_min': True}
+        category = request.args.get('category')
+        if category:
+            query['category'] = category
+        after = request.args.get('after')
+        if after:
+            try:
+                query.update(keyset_filter('_id', decode_cursor(after)))
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+
+        limit = parse_limit(request.args.get('limit'))
+        mongo = current_app.mongo
+        documents = list(mongo.db.products.find(query).sort('_id', 1).limit(limit + 1))
+        page, next_cursor = split_page(documents, limit, ['_id'])
+
+        products = []
+        for product in page:
+            item = serialize_inventory_item(product)
+            # Same reading of the stored values as the below_min flag, whatever their type or place
+            item['quantity'], item['min_quantity'] = counters.stock_levels(product)
+            item['shortfall'] = item['min_quantity'] - item['quantity']
+            products.append(item)
+
+        return jsonify({'products': products, 'next_cursor': next_cursor}), 200
+
+    except Exception as e:
+        logging.error(f"Error fetching low stock: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
+# ============================
+# Usage History Route
+# ============================
+# Longest range and number of products one usage query may cover
+MAX_USAGE_DAYS = 366
+MAX_USAGE_PRODUCTS = 50
+
+# Per-product daily usage and receipts, read from the daily ledger buckets
+# Query parameters: product_id (comma-separated), from/to (dates, default the last 30 days)
+@inventory_bp.route('/admin/inventory/usage', methods=['GET'])
+@jwt_required()
+def get_usage():
+    try:
+        current_user = get_jwt_identity()
+        if current_user['role'] != 'admin':
+            return jsonify({'message': 'Access forbidden'}), 403
+
+        product_ids = [product_id for product_id in request.args.get('product_id', '').split(',') if product_id]
+        if not product_ids or len(product_ids) > MAX_USAGE_PRODUCTS:
+            return jsonify({'message': f"Between 1 and {MAX_USAGE_PRODUCTS} product IDs are required"}), 400
+        invalid = [product_id for product_id in product_ids if not is_valid_objectid(product_id)]
+        if invalid:
+            return jsonify({'message': f"Invalid product IDs: {', '.join(invalid)}"}), 400
+
+        try:
+            end = parse_datetime_param(request.args.get('to'), end_of_day=True) or datetime.utcnow()
+            start = parse_datetime_param(request.args.get('from')) or end - timedelta(days=29)
+        except ValueError:
+            return jsonify({'message': 'Invalid date range'}), 400
+        if start > end or (end - start).days >= MAX_USAGE_DAYS:
+            return jsonify({'message': f"Date range must cover 1 to {MAX_USAGE_DAYS} days"}), 400
 
+        mongo = current_app.mongo
+        usage = ledger.daily_usage(mongo.db, product_ids, start, end)
+        return jsonify({'from': ledger.day_of(start), 'to': ledger.day_of(end), 'usage': usage}), 200
+
+    except Exception as e:
+        logging.error(f"Error fetching usage: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
+
+# Helper function to validate the submitted inventory check
+# Returns (usage list of (product_id, quantity_used), error message)
+def parse_inventory_items(inventory_results):
+    usage = []
+    seen = set()
+    for item in inventory_results:
+        product_id = item.get('product_id')
+        if not is_valid_objectid(product_id):
+            return None, f"Invalid product ID: {product_id}"
+        if product_id in seen:
+            return None, f"Duplicate product ID: {product_id}"
+        seen.add(product_id)
+
+        try:
+            quantity_used = to_number(item.get('used_today', 0), int)
+        except ValueError:
+            return None, f"Invalid used quantity for product {product_id}"
+        usage.append((product_id, quantity_used))
+    return usage, None
+
+# Build one atomic update per product: remember the current quantity as previous,
+# subtract the usage clamped at zero, record today's usage and refresh below_min, all server-side
+def build_inventory_updates(usage):
+    return [
+        UpdateOne(
+            {'_id': ObjectId(product_id)},
+            [{'$set': {
+                'previous_quantity': CURRENT_QUANTITY,
+                'attributes.quantity': {'$max': [0, {'$subtract': [CURRENT_QUANTITY, quantity_used]}]},
+                'used_today': quantity_used
+            }}, BELOW_MIN_STAGE]
+        )
+        for product_id, quantity_used in usage
+    ]
+
+# Save an inventory count in a single bulk write
+# Body: {'inventory': [{'product_id', 'used_today'}], 'atomic': bool}
+# The count always runs in a transaction, so the stock levels read for the low-stock counter
+# and the ledger are the ones the bulk write changes (a concurrent write to the same products
+# conflicts and the transaction is retried). With 'atomic' set, a missing product aborts it.
 @inventory_bp.route('/save_inventory_check', methods=['POST'])
 @jwt_required()
 def save_inventory_check():
     try:
         data = request.get_json()
         inventory_results = data.get('inventory', [])
+        atomic = bool(data.get('atomic', False))
         mongo = current_app.mongo
 
-        for item in inventory_results:
-            product_id = item.get('product_id')
-            quantity_used = safe_int(item.get('used_today', 0))
+        usage, error = parse_inventory_items(inventory_results)
+        if error:
+            return jsonify({'message': error}), 400
+        if not usage:
+            return jsonify({'message': 'Inventory check saved successfully', 'results': []}), 200
+
+        updates = build_inventory_updates(usage)
+        object_ids = [ObjectId(product_id) for product_id, _ in usage]
+
+        counted_by = get_jwt_identity()['email']
+        events = []
 
-            if not is_valid_objectid(product_id):
-                return jsonify({'message': f"Invalid product ID: {product_id}"}), 400
+        def apply(session):
+            events[:] = []
+            # One lookup tells us which submitted products still exist, and their stock levels
+            # so the low-stock counter can follow the same clamped arithmetic as the updates
+            projection = {'attributes.quantity': 1, 'attributes.min_quantity': 1, 'min_quantity': 1}
+            before = {
+                str(product['_id']): product
+                for product in mongo.db.products.find({'_id': {'$in': object_ids}}, projection, session=session)
+            }
+            found = set(before)
+            missing = [product_id for product_id, _ in usage if product_id not in found]
+            if atomic and missing:
+                session.abort_transaction()
+                return found, missing, None
+            result = mongo.db.products.bulk_write(updates, ordered=False, session=session)
 
-            product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
-            if not product:
-                return jsonify({'message': f"Product with ID {product_id} not found"}), 404
+            low_stock = 0
+            for product_id, quantity_used in usage:
+                product = before.get(product_id)
+                if product is None:
+                    continue
+                attributes = product.get('attributes') or {}
+                quantity_before = counters.as_int(attributes.get('quantity', 0))
+                quantity = max(0, quantity_before - quantity_used)
+                low_stock += counters.low_stock_change(product, dict(product, attributes=dict(attributes, quantity=quantity)))
+                events.append(ledger.event('count', product_id, counted_by, used=quantity_used,
+                                           quantity_before=quantity_before, quantity=quantity))
+            counters.increment(mongo.db, {'products.low_stock': low_stock}, session=session)
+            ledger.record_buckets(mongo.db, events, session=session)
+            return found, missing, result
 
-            # Access quantity from attributes
-            attributes = product.get('attributes', {})
-            current_quantity = safe_int(attributes.get('quantity', 0))
-            previous_quantity = current_quantity  # Save the current quantity as previous before updating
-            new_quantity = current_quantity - quantity_used  # Update the current quantity
+        with mongo.cx.start_session() as session:
+            found, missing, result = session.with_transaction(apply)
 
-            # Ensure quantity doesn't go negative
-            if new_quantity < 0:
-                new_quantity = 0
+        if result is not None:
+            ledger.append_events(mongo.db, events)
+            if result.modified_count:
+                current_app.versions.bump('products')
 
-            # Update attributes with the new quantity
-            attributes['quantity'] = new_quantity
+        results = [
+            {'product_id': product_id, 'status': 'updated' if product_id in found else 'not_found'}
+            for product_id, _ in usage
+        ]
 
-            # Update the product with both the new current and previous quantities
-            mongo.db.products.update_one(
-                {'_id': ObjectId(product_id)},
-                {'$set': {
-                    'attributes': attributes,
-                    'used_today': quantity_used,
-                    'previous_quantity': previous_quantity  # Save current as previous
-                }}
-            )
+        if result is None:
+            for entry in results:
+                if entry['status'] == 'updated':
+                    entry['status'] = 'skipped'
+            return jsonify({
+                'message': f"Products not found: {', '.join(missing)}",
+                'results': results
+            }), 404
 
-        return jsonify({'message': 'Inventory check saved successfully'}), 200
+        return jsonify({
+            'message': 'Inventory check saved successfully',
+            'results': results,
+            'matched': result.matched_count,
+            'modified': result.modified_count
+        }), 200
 
+    except BulkWriteError as e:
+        logging.error(f"Error saving inventory check: {e.details}")
+        failures = [
+            {'index': error['index'], 'message': error.get('errmsg', '')}
+            for error in e.details.get('writeErrors', [])
+        ]
+        return jsonify({'message': 'Server error: inventory check failed', 'failures': failures}), 500
     except Exception as e:
         logging.error(f"Error saving inventory check: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
@@ -0,0 +1,109 @@
+# routes/live_chat.py
+
+from flask import current_app, request
+from flask_jwt_extended import decode_token
+from flask_socketio import ConnectionRefusedError, emit, join_room
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG)
+
+# Room every admin connection joins (support requests are broadcast there)
+ADMIN_ROOM = 'admin'
+
+# JWT identity of each connection handled by this worker, keyed by Socket.IO session id
+connected_users = {}
+
+# Helper function to name the personal room of a user (all their open connections)
+def user_room(user_id):
+    return f"user:{user_id}"
+
+# Helper function to name the live support room of a user
+def support_room(user_id):
+    return f"support:{user_id}"
+
+# Push an event to every connection of a user. Safe to call from HTTP routes in any
+# worker process: with SOCKETIO_MESSAGE_QUEUE configured the event fans out through the queue
+def notify_user(user_id, event, payload):
+    socketio = getattr(current_app, 'socketio', None)
+    if socketio is None:
+        return
+    try:
+        socketio.emit(event, payload, to=user_room(user_id))
+    except Exception as e:
+        logging.error(f"Error pushing {event} to user {user_id}: {e}")
+
+# Register the Socket.IO event handlers
+def register_socket_handlers(socketio):
+
+    # Authenticate the connection with the same JWT used by the REST API
+    # (sent as auth={'token': ...} or ?token=...)
+    @socketio.on('connect')
+    def handle_connect(auth=None):
+        token = (auth or {}).get('token') or request.args.get('token')
+        if not token:
+            raise ConnectionRefusedError('Authentication required')
+        try:
+            identity = decode_token(token)[current_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+        except Exception:
+            raise ConnectionRefusedError('Invalid token')
+
+        connected_users[request.sid] = identity
+        join_room(user_room(identity['id']))
+        if identity['role'] == 'admin':
+            join_room(ADMIN_ROOM)
+        emit('connected', {'data': 'Connected to the server'})
+
+    @socketio.on('disconnect')
+    def handle_disconnect():
+        connected_users.pop(request.sid, None)
+
+    # User initiates a support chat
+    @socketio.on('initiate_chat')
+    def handle_initiate_chat(data):
+        identity = connected_users.get(request.sid)
+        if not identity:
+            return
+        join_room(support_room(identity['id']))
+
+        # Notify admins about the incoming chat request
+        emit('support_request', {
+            'user_id': identity['id'],
+            'user_email': identity['email'],
+            'issue': (data or {}).get('issue', '')
+        }, to=ADMIN_ROOM)
+
+    # Admin accepts a support chat
+    @socketio.on('accept_chat')
+    def handle_accept_chat(data):
+        identity = connected_users.get(request.sid)
+        user_id = (data or {}).get('user_id')
+        if not identity or identity['role'] != 'admin' or not user_id:
+            return
+
+        # Join the room for real-time communication and tell the user
+        join_room(support_room(user_id))
+        emit('chat_accepted', {'admin_id': identity['id']}, to=support_room(user_id))
+
+    # User sends a live support message
+    @socketio.on('send_message')
+    def handle_message(data):
+        identity = connected_users.get(request.sid)
+        message = (data or {}).get('message')
+        if not identity or not message:
+            return
+        emit('receive_message', {
+            'message': message, 'content': message, 'sender': 'user', 'user_id': identity['id']
+        }, to=support_room(identity['id']), include_self=False)
+
+    # Admin answers in a support chat
+    @socketio.on('admin_message')
+    def handle_admin_message(data):
+        identity = connected_users.get(request.sid)
+        room = (data or {}).get('room')
+        message = (data or {}).get('message')
+        if not identity or identity['role'] != 'admin' or not room or not message:
+            return
+        emit('receive_message', {
+            'message': message, 'content': message, 'sender': 'admin', 'user_id': room
+        }, to=support_room(room), include_self=False)
@@ -4,6 +4,13 @@ from bson.objectid import ObjectId
 import logging
 from datetime import datetime
 
+from services import counters
+from services.product_schema import BELOW_MIN_STAGE, CURRENT_QUANTITY
+from services import reorder, ledger
+from services.pagination import (
+    parse_limit, decode_cursor, keyset_filter, split_page, parse_datetime_param, date_range_filter
+)
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -46,6 +53,7 @@ def place_order():
             'status': 'pending',
             'created_at': datetime.utcnow()
         })
+        counters.increment(mongo.db, {'orders.total': 1, counters.key('orders', 'pending'): 1})
 
         return jsonify({'message': 'Order placed successfully'}), 200
 
@@ -53,12 +61,84 @@ def place_order():
         logging.error(f"Error placing order: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 # ============================
-# Get All Pending Orders (Admin Only)
+# Orders Listing Helpers
 # ============================
+ORDER_STATUSES = ('pending', 'received')
+
+# Build the aggregation that pages through orders and resolves each product name
+# with a single $lookup instead of one products query per order
+def build_orders_pipeline(query, limit):
+    return [
+        {'$match': query},
+        {'$sort': {'created_at': -1, '_id': -1}},
+        {'$limit': limit + 1},
+        {'$lookup': {
+            'from': 'products',
+            'let': {'product_id': {'$convert': {
+                'input': '$product_id', 'to': 'objectId', 'onError': None, 'onNull': None
+            }}},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$_id', '$$product_id']}}},
+                {'$project': {'name': 1}}
+            ],
+            'as': 'product'
+        }},
+        {'$addFields': {
+            'product_name': {'$ifNull': [{'$arrayElemAt': ['$product.name', 0]}, 'Unknown']}
+        }},
+        {'$project': {'product': 0}}
+    ]
+
+# Helper function to shape an order for the admin listings
+def serialize_order(order):
+    return {
+        'id': str(order['_id']),
+        'product_id': order['product_id'],
+        'product_name': order.get('product_name', 'Unknown'),
+        'order_quantity': order['order_quantity'],
+        'status': order.get('status', 'pending'),  # Ensure status is fetched and default to 'pending'
+        'created_at': order['created_at']
+    }
+
+# Run a paginated orders listing for the current request
+# Query parameters: limit, after (cursor), from/to (created_at range), status (when not fixed by the route)
+def list_orders(status=None):
+    status = status or request.args.get('status')
+    if status and status not in ORDER_STATUSES:
+        return jsonify({'message': f"Invalid status: {status}"}), 400
+
+    try:
+        start = parse_datetime_param(request.args.get('from'))
+        end = parse_datetime_param(request.args.get('to'), end_of_day=True)
+    except ValueError:
+        return jsonify({'message': 'Invalid date range'}), 400
+
+    query = {}
+    if status:
+        query['status'] = status
+    query.update(date_range_filter('created_at', start, end))
+
+    after = request.args.get('after')
+    if after:
+        try:
+            query.update(keyset_filter('created_at', decode_cursor(after), descending=True))
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+
+    limit = parse_limit(request.args.get('limit'))
+    mongo = current_app.mongo
+    documents = list(mongo.db.orders.aggregate(build_orders_pipeline(query, limit)))
+    page, next_cursor = split_page(documents, limit, ['created_at', '_id'])
+
+    return jsonify({
+        'orders': [serialize_order(order) for order in page],
+        'next_cursor': next_cursor
+    }), 200
+
 # ============================
-# Get All Pending Orders (Admin Only)
+# Get Pending Orders (Admin Only)
 # ============================
-@orders_bp.route('/admin/orders', methods=['GET'])
+@orders_bp.route('/admin/orders/pending', methods=['GET'])
 @jwt_required()
 def get_pending_orders():
     try:
@@ -66,22 +146,7 @@ def get_pending_orders():
         if current_user['role'] != 'admin':
             return jsonify({'message': 'Access forbidden'}), 403
 
-        mongo = current_app.mongo
-        orders_cursor = mongo.db.orders.find({'status': 'pending'})  # Fetch only pending orders
-        orders = []
-        for order in orders_cursor:
-            product = mongo.db.products.find_one({'_id': ObjectId(order['product_id'])})
-            product_name = product['name'] if product else 'Unknown'
-            orders.append({
-                'id': str(order['_id']),
-                'product_id': order['product_id'],
-                'product_name': product_name,
-                'order_quantity': order['order_quantity'],
-                'status': order.get('status', 'pending'),  # Ensure status is fetched and default to 'pending'
-                'created_at': order['created_at']
-            })
-
-        return jsonify(orders), 200
+        return list_orders(status='pending')
 
     except Exception as e:
         logging.error(f"Error fetching pending orders: {e}")
@@ -89,22 +154,63 @@ def get_pending_orders():
 
 
 # ============================
-# Receive an Order and Update Product Quantity
-# ============================
-# ============================
-# Receive an Order and Update Product Quantity
-# ============================
-# ============================
-# Receive an Order and Update Product Quantity
-# ============================
-# Receive an Order and Update Product Quantity
-# ============================
-# ============================
-# Receive an Order and Update Product Quantity
-# ============================
-# ============================
-# Receive an Order and Update Product Quantity
+# Receive Orders and Update Product Quantity
 # ============================
+# Raised inside a receive transaction when the ordered product no longer exists
+class ProductNotFound(Exception):
+    pass
+
+# Receive one order inside a transaction: the order moves pending -> received only once,
+# and the ordered quantity is added to the product in the same atomic unit.
+# The receipt is added to the usage ledger: its daily bucket in the transaction, the raw event after it.
+# Returns 'received', 'already_received' or 'not_found'
+def receive_order_in_transaction(mongo, session, order_id, received_by):
+    events = []
+
+    def callback(session):
+        events[:] = []
+        order = mongo.db.orders.find_one_and_update(
+            {'_id': ObjectId(order_id), 'status': 'pending'},
+            {'$set': {'status': 'received', 'received_at': datetime.utcnow(), 'received_by': received_by}},
+            session=session
+        )
+        if not order:
+            existing = mongo.db.orders.find_one({'_id': ObjectId(order_id)}, {'_id': 1}, session=session)
+            return 'already_received' if existing else 'not_found'
+
+        order_quantity = int(order.get('order_quantity', 0))
+        before = mongo.db.products.find_one_and_update(
+            {'_id': ObjectId(order['product_id'])},
+            [{'$set': {
+                'previous_quantity': CURRENT_QUANTITY,
+                'attributes.quantity': {'$add': [CURRENT_QUANTITY, order_quantity]},
+                'used_today': 0  # Reset 'used_today' after receiving the order
+            }}, BELOW_MIN_STAGE],
+            projection={'attributes.quantity': 1, 'attributes.min_quantity': 1, 'min_quantity': 1},
+            session=session
+        )
+        if before is None:
+            raise ProductNotFound(order['product_id'])
+
+        attributes = before.get('attributes') or {}
+        quantity = counters.as_int(attributes.get('quantity', 0)) + order_quantity
+        after = dict(before, attributes=dict(attributes, quantity=quantity))
+        counters.increment(mongo.db, {
+            counters.key('orders', 'pending'): -1,
+            counters.key('orders', 'received'): 1,
+            'products.low_stock': counters.low_stock_change(before, after)
+        }, session=session)
+        events.append(ledger.event('receipt', order['product_id'], received_by, received=order_quantity,
+                                   quantity_before=quantity - order_quantity, quantity=quantity,
+                                   order_id=order_id))
+        ledger.record_buckets(mongo.db, events, session=session)
+        return 'received'
+
+    status = session.with_transaction(callback)
+    if status == 'received':
+        ledger.append_events(mongo.db, events)
+    return status
+
 @orders_bp.route('/admin/orders/receive/<order_id>', methods=['POST'])
 @jwt_required()
 def receive_order(order_id):
@@ -114,51 +220,70 @@ def receive_order(order_id):
         if current_user['role'] != 'admin':
             return jsonify({'message': 'Access forbidden'}), 403
 
+        if not is_valid_objectid(order_id):
+            return jsonify({'message': 'Invalid order ID'}), 400
+
         mongo = current_app.mongo
-        order = mongo.db.orders.find_one({'_id': ObjectId(order_id)})
+        with mongo.cx.start_session() as session:
+            status = receive_order_in_transaction(mongo, session, order_id, current_user['email'])
 
-        if not order:
+        if status == 'not_found':
             return jsonify({'message': 'Order not found'}), 404
+        if status == 'already_received':
+            return jsonify({'message': 'Order already received'}), 200
 
-        product_id = order.get('product_id')
-        order_quantity = int(order.get('order_quantity', 0))
-
-        product = mongo.db.products.find_one({'_id': ObjectId(product_id)})
+        current_app.versions.bump('products')
+        return jsonify({'message': 'Order received and product quantity updated'}), 200
 
-        if not product:
-            return jsonify({'message': 'Product not found'}), 404
+    except ProductNotFound:
+        return jsonify({'message': 'Product not found'}), 404
+    except Exception as e:
+        logging.error(f"Error receiving order: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
 
-        # Access quantity from attributes
-        attributes = product.get('attributes', {})
-        current_quantity = int(attributes.get('quantity', 0))
-        new_quantity = current_quantity + order_quantity
+# Receive many orders in one call
+# Body: {'order_ids': [...]}; each order is received in its own transaction
+@orders_bp.route('/admin/orders/receive', methods=['POST'])
+@jwt_required()
+def receive_orders():
+    try:
+        current_user = get_jwt_identity()
 
-        # Update quantity within attributes
-        attributes['quantity'] = new_quantity
+        if current_user['role'] != 'admin':
+            return jsonify({'message': 'Access forbidden'}), 403
 
-        # Update the product's attributes in the database
-        mongo.db.products.update_one(
-            {'_id': ObjectId(product_id)},
-            {'$set': {
-                'attributes': attributes,
-                'previous_quantity': current_quantity,
-                'used_today': 0  # Reset 'used_today' after receiving the order
-            }}
-        )
+        data = request.get_json()
+        order_ids = data.get('order_ids', [])
 
-        # Mark the order as received in the orders collection
-        mongo.db.orders.update_one(
-            {'_id': ObjectId(order_id)},
-            {'$set': {'status': 'received'}}
-        )
+        if not isinstance(order_ids, list) or not order_ids:
+            return jsonify({'message': 'A list of order IDs is required'}), 400
+        invalid = [order_id for order_id in order_ids if not is_valid_objectid(order_id)]
+        if invalid:
+            return jsonify({'message': f"Invalid order IDs: {', '.join(map(str, invalid))}"}), 400
 
-        return jsonify({'message': 'Order received and product quantity updated'}), 200
+        mongo = current_app.mongo
+        results = []
+        with mongo.cx.start_session() as session:
+            for order_id in dict.fromkeys(order_ids):
+                try:
+                    status = receive_order_in_transaction(mongo, session, order_id, current_user['email'])
+                except ProductNotFound:
+                    status = 'product_not_found'
+                results.append({'order_id': order_id, 'status': status})
+
+        received = sum(1 for result in results if result['status'] == 'received')
+        if received:
+            current_app.versions.bump('products')
+        return jsonify({'message': f"{received} order(s) received", 'results': results}), 200
 
     except Exception as e:
-        logging.error(f"Error receiving order: {e}")
+        logging.error(f"Error receiving orders: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
 
+# ============================
+# Get All Orders (Admin Only)
+# ============================
 @orders_bp.route('/admin/orders', methods=['GET'])
 @jwt_required()
 def get_all_orders():
@@ -167,23 +292,64 @@ def get_all_orders():
         if current_user['role'] != 'admin':
             return jsonify({'message': 'Access forbidden'}), 403
 
-        mongo = current_app.mongo
-        orders_cursor = mongo.db.orders.find()  # Fetch all orders
-        orders = []
-        for order in orders_cursor:
-            product = mongo.db.products.find_one({'_id': ObjectId(order['product_id'])})
-            product_name = product['name'] if product else 'Unknown'
-            orders.append({
-                'id': str(order['_id']),
-                'product_id': order['product_id'],
-                'product_name': product_name,
-                'order_quantity': order['order_quantity'],
-                'status': order.get('status', 'pending'),  # Ensure status is fetched and default to 'pending'
-                'created_at': order['created_at']
-            })
-
-        return jsonify(orders), 200
+        return list_orders()
 
     except Exception as e:
         logging.error(f"Error fetching orders: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
+
+
+# ============================
+# Reorder Below-Minimum Stock (Admin Only)
+# ============================
+# Body (all optional): {'dry_run': bool, 'product_ids': [...], 'target_factor': n, 'cover_days': n}
+# With dry_run the suggested orders are returned without creating them
+@orders_bp.route('/admin/orders/reorder', methods=['POST'])
+@jwt_required()
+def reorder_low_stock():
+    try:
+        current_user = get_jwt_identity()
+
+        if current_user['role'] != 'admin':
+            return jsonify({'message': 'Access forbidden'}), 403
+
+        data = request.get_json(silent=True) or {}
+        dry_run = bool(data.get('dry_run', False))
+        try:
+            target_factor = float(data.get('target_factor', current_app.config.get('REORDER_TARGET_FACTOR', reorder.DEFAULT_TARGET_FACTOR)))
+            cover_days = float(data.get('cover_days', current_app.config.get('REORDER_COVER_DAYS', reorder.DEFAULT_COVER_DAYS)))
+        except (ValueError, TypeError):
+            return jsonify({'message': 'Invalid target factor or cover days'}), 400
+        if target_factor < 1 or cover_days < 0:
+            return jsonify({'message': 'Invalid target factor or cover days'}), 400
+
+        product_ids = data.get('product_ids')
+        if product_ids is not None:
+            if not isinstance(product_ids, list) or not all(is_valid_objectid(product_id) for product_id in product_ids):
+                return jsonify({'message': 'Invalid product IDs'}), 400
+            product_ids = [ObjectId(product_id) for product_id in product_ids]
+
+        mongo = current_app.mongo
+        usage_days = int(current_app.config.get('REORDER_USAGE_DAYS', reorder.DEFAULT_USAGE_DAYS))
+        suggestions, skipped = reorder.plan_reorders(mongo.db, target_factor, cover_days, product_ids, usage_days)
+        if dry_run:
+            return jsonify({'dry_run': True, 'orders': suggestions, 'skipped': skipped}), 200
+
+        created = reorder.create_reorders(mongo.db, suggestions, current_user['email'])
+        created_ids = {suggestion['product_id'] for suggestion in created}
+        skipped += [
+            {'product_id': suggestion['product_id'], 'name': suggestion['name'], 'reason': 'pending_order'}
+            for suggestion in suggestions if suggestion['product_id'] not in created_ids
+        ]
+        counters.increment(mongo.db, {'orders.total': len(created), counters.key('orders', 'pending'): len(created)})
+
+        return jsonify({
+            'message': f"{len(created)} order(s) placed",
+            'dry_run': False,
+            'orders': created,
+            'skipped': skipped
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error generating reorders: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
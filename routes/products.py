@@ -2,12 +2,19 @@ from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_cors import CORS
 from flask_uploads import UploadNotAllowed
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
 from datetime import datetime
 from bson.objectid import ObjectId
-import os
 import json
 
+from services.image_store import ImageTooLarge
+from services.pagination import parse_limit, decode_cursor, keyset_filter, split_page
+from services.conditional import versioned
+from services.attribute_query import compile_attribute_filter, parse_attribute_order, require_sort_field
+from services import counters
+from services.product_schema import validate_attributes
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -40,6 +47,9 @@ def add_product():
         # Access MongoDB
         mongo = current_app.mongo
 
+        # Refuse oversized uploads before the multipart body is read
+        current_app.image_store.check_request_size()
+
         # Get product data from the request
         name = request.form.get('name')
         category = request.form.get('category')
@@ -52,18 +62,21 @@ def add_product():
 
         # Process attributes
         attributes = json.loads(attributes) if attributes else {}
+        try:
+            attributes = validate_attributes(attributes)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
 
         # Check if the category exists
-        existing_category = mongo.db.categories.find_one({'name': category})
-        if not existing_category:
+        if not current_app.category_cache.exists(category):
             return jsonify({'message': 'Category does not exist'}), 400
 
         # Handle image upload
         image_path = ''
+        image_meta = None
         if image_file:
-            images = current_app.images
-            filename = images.save(image_file)
-            image_path = os.path.join('/uploads/images/', filename)
+            image_meta = current_app.image_store.save(image_file)
+            image_path = image_meta['url']
         elif image_url:
             image_path = image_url  # Assuming the image_url is a valid URL
 
@@ -73,49 +86,182 @@ def add_product():
             'category': category,
             'attributes': attributes,
             'image': image_path,
+            'image_meta': image_meta,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
 
+        product['below_min'] = counters.is_low_stock(product)
+
         # Insert into MongoDB
         result = mongo.db.products.insert_one(product)
+        counters.increment(mongo.db, {'products.total': 1, 'products.low_stock': int(product['below_min'])})
+        current_app.product_suggester.record(str(result.inserted_id), name)
+        current_app.versions.bump('products')
         logging.info(f"Product {name} added by {current_user['email']}")
 
         return jsonify({'message': 'Product added successfully', 'product_id': str(result.inserted_id)}), 201
 
     except UploadNotAllowed:
         return jsonify({'message': 'File type not allowed'}), 400
+    except (ImageTooLarge, RequestEntityTooLarge):
+        return jsonify({'message': 'Image is too large'}), 413
     except Exception as e:
         logging.error(f"Error adding product: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
-# Route to list all products
+# Fields returned by the public product listing
+PRODUCT_LIST_PROJECTION = {
+    'name': 1,
+    'category': 1,
+    'attributes': 1,
+    'image': 1,
+    'created_at': 1,
+    'updated_at': 1
+}
+
+# Sort orders supported by the product listing: (field, descending)
+PRODUCT_LIST_ORDERS = {
+    'id': ('_id', False),
+    'updated_at': ('updated_at', True)
+}
+
+# Deepest page a search can request
+MAX_SEARCH_PAGE = 50
+
+# Helper function to shape a product document for the public listing
+def serialize_product(product):
+    return {
+        'id': str(product['_id']),
+        'name': product['name'],
+        'category': product['category'],
+        'attributes': product.get('attributes', {}),
+        'image': product.get('image', ''),
+        'created_at': product.get('created_at'),
+        'updated_at': product.get('updated_at')
+    }
+
+# Route to list products one page at a time
+# Query parameters: limit, after (cursor from a previous page), category,
+# order ('id', 'updated_at', 'attr.<key>' or '-attr.<key>') and attr.* filters (services/attribute_query.py)
 @products_bp.route('/products', methods=['GET'])
+@versioned('products')
 def list_products():
     try:
         # Access MongoDB
         mongo = current_app.mongo
 
-        # Fetch all products
-        products_cursor = mongo.db.products.find()
-        products = []
-        for product in products_cursor:
-            products.append({
-                'id': str(product['_id']),
-                'name': product['name'],
-                'category': product['category'],
-                'attributes': product.get('attributes', {}),
-                'image': product.get('image', ''),
-                'created_at': product['created_at'],
-                'updated_at': product['updated_at']
-            })
-
-        return jsonify(products), 200
+        limit = parse_limit(request.args.get('limit'))
+        category = request.args.get('category')
+        after = request.args.get('after')
+        order = request.args.get('order', 'id')
+
+        try:
+            attribute_filter = compile_attribute_filter(request.args)
+            sort = PRODUCT_LIST_ORDERS.get(order) or parse_attribute_order(order)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        if sort is None:
+            return jsonify({'message': f"Invalid order: {order}"}), 400
+        sort_field, descending = sort
+
+        # Serve the default _id ordering from the in-memory mirror when it is loaded
+        mirror = current_app.product_mirror
+        if mirror.fresh() and sort_field == '_id' and not attribute_filter:
+            try:
+                after_id = decode_cursor(after)[0] if after else None
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+            page, next_cursor = split_page(mirror.page(limit, after_id, category), limit, ['_id'])
+            return jsonify({
+                'products': [serialize_product(product) for product in page],
+                'next_cursor': next_cursor
+            }), 200
+
+        # Push the category filter and the keyset position into the query
+        query = dict(attribute_filter)
+        if category:
+            query['category'] = category
+        require_sort_field(query, sort_field)
+        if after:
+            try:
+                query.update(keyset_filter(sort_field, decode_cursor(after), descending))
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+
+        direction = -1 if descending else 1
+        sort = [('_id', direction)] if sort_field == '_id' else [(sort_field, direction), ('_id', direction)]
+
+        # Fetch one extra document to know whether another page exists
+        products_cursor = mongo.db.products.find(query, PRODUCT_LIST_PROJECTION).sort(sort).limit(limit + 1)
+        cursor_fields = ['_id'] if sort_field == '_id' else [sort_field, '_id']
+        page, next_cursor = split_page(list(products_cursor), limit, cursor_fields)
+
+        return jsonify({
+            'products': [serialize_product(product) for product in page],
+            'next_cursor': next_cursor
+        }), 200
 
     except Exception as e:
         logging.error(f"Error fetching products: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
+# Route to search products by keyword, best matches first
+# Served by the text index over name, description and category
+# Query parameters: q, category, page (1-based), limit
+@products_bp.route('/products/search', methods=['GET'])
+@versioned('products')
+def search_products():
+    try:
+        keywords = (request.args.get('q') or '').strip()
+        if not keywords:
+            return jsonify({'message': 'Search query is required'}), 400
+
+        limit = parse_limit(request.args.get('limit'), default=20, maximum=100)
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+        except ValueError:
+            return jsonify({'message': 'Invalid page'}), 400
+        # Relevance pages can't be resumed from a key, so they are skipped to; keep that bounded
+        if page > MAX_SEARCH_PAGE:
+            return jsonify({'message': f"Page must be at most {MAX_SEARCH_PAGE}"}), 400
+
+        query = {'$text': {'$search': keywords}}
+        category = request.args.get('category')
+        if category:
+            query['category'] = category
+
+        mongo = current_app.mongo
+        score = {'score': {'$meta': 'textScore'}}
+        products_cursor = mongo.db.products.find(query, dict(PRODUCT_LIST_PROJECTION, **score)) \
+            .sort([('score', {'$meta': 'textScore'}), ('_id', 1)]) \
+            .skip((page - 1) * limit) \
+            .limit(limit + 1)
+        documents = list(products_cursor)
+
+        return jsonify({
+            'products': [dict(serialize_product(product), score=product.get('score')) for product in documents[:limit]],
+            'page': page,
+            'has_more': len(documents) > limit
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error searching products: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
+# Route to autocomplete product names from a prefix
+# Answered from the in-process name index, without a database query
+@products_bp.route('/products/suggest', methods=['GET'])
+def suggest_products():
+    try:
+        prefix = request.args.get('q', '')
+        limit = parse_limit(request.args.get('limit'), default=10, maximum=50)
+        return jsonify({'suggestions': current_app.product_suggester.suggest(prefix, limit)}), 200
+
+    except Exception as e:
+        logging.error(f"Error suggesting products: {e}")
+        return jsonify({'message': f"Server error: {str(e)}"}), 500
+
 # Route to update a product (admin only)
 @products_bp.route('/admin/products/<product_id>', methods=['PUT'])
 @jwt_required()
@@ -139,6 +285,9 @@ def update_product(product_id):
         if not existing_product:
             return jsonify({'message': 'Product not found'}), 404
 
+        # Refuse oversized uploads before the multipart body is read
+        current_app.image_store.check_request_size()
+
         # Get update data
         name = request.form.get('name')
         category = request.form.get('category')
@@ -149,6 +298,10 @@ def update_product(product_id):
 
         # Process attributes
         attributes = json.loads(attributes) if attributes else {}
+        try:
+            attributes = validate_attributes(attributes)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         remove_attributes = json.loads(remove_attributes) if remove_attributes else []
 
         # Prepare update fields
@@ -156,12 +309,12 @@ def update_product(product_id):
         if name:
             update_fields['name'] = name
         if category:
-            existing_category = mongo.db.categories.find_one({'name': category})
-            if not existing_category:
+            if not current_app.category_cache.exists(category):
                 return jsonify({'message': 'Category does not exist'}), 400
             update_fields['category'] = category
 
         # Handle attributes
+        was_low_stock = counters.is_low_stock(existing_product)
         existing_attributes = existing_product.get('attributes', {})
         if attributes:
             # Update or add attributes
@@ -171,15 +324,17 @@ def update_product(product_id):
             for attr in remove_attributes:
                 existing_attributes.pop(attr, None)
         update_fields['attributes'] = existing_attributes
+        is_low_stock = counters.is_low_stock(dict(existing_product, attributes=existing_attributes))
+        update_fields['below_min'] = is_low_stock
 
         # Handle image upload
         if image_file:
-            images = current_app.images
-            filename = images.save(image_file)
-            image_path = os.path.join('/uploads/images/', filename)
-            update_fields['image'] = image_path
+            image_meta = current_app.image_store.save(image_file)
+            update_fields['image'] = image_meta['url']
+            update_fields['image_meta'] = image_meta
         elif image_url:
             update_fields['image'] = image_url
+            update_fields['image_meta'] = None
 
         # Update the product
         result = mongo.db.products.update_one(
@@ -187,11 +342,17 @@ def update_product(product_id):
             {'$set': update_fields}
         )
 
+        counters.increment(mongo.db, {'products.low_stock': int(is_low_stock) - int(was_low_stock)})
+        if name and name != existing_product.get('name'):
+            current_app.product_suggester.record(product_id, name)
+        current_app.versions.bump('products')
         logging.info(f"Product {product_id} updated by {current_user['email']}")
         return jsonify({'message': 'Product updated successfully'}), 200
 
     except UploadNotAllowed:
         return jsonify({'message': 'File type not allowed'}), 400
+    except (ImageTooLarge, RequestEntityTooLarge):
+        return jsonify({'message': 'Image is too large'}), 413
     except Exception as e:
         logging.error(f"Error updating product: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
@@ -215,11 +376,18 @@ def delete_product(product_id):
         mongo = current_app.mongo
 
         # Delete the product
-        result = mongo.db.products.delete_one({'_id': ObjectId(product_id)})
+        deleted = mongo.db.products.find_one_and_delete(
+            {'_id': ObjectId(product_id)},
+            {'attributes.quantity': 1, 'attributes.min_quantity': 1, 'min_quantity': 1}
+        )
 
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({'message': 'Product not found'}), 404
 
+        counters.increment(mongo.db, {'products.total': -1, 'products.low_stock': counters.low_stock_change(deleted, None)})
+        current_app.product_suggester.forget(product_id)
+
+        current_app.versions.bump('products')
         logging.info(f"Product {product_id} deleted by {current_user['email']}")
         return jsonify({'message': 'Product deleted successfully'}), 200
 
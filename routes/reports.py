@@ -4,6 +4,12 @@ from bson.objectid import ObjectId
 from datetime import datetime
 import logging
 
+from services.streaming import wants_stream, stream_ndjson
+from services.pagination import (
+    parse_limit, decode_cursor, keyset_filter, split_page, parse_datetime_param, date_range_filter
+)
+from services import counters
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -49,6 +55,7 @@ def submit_report():
         }
 
         result = mongo.db.reports.insert_one(report)
+        counters.increment(mongo.db, {'reports.total': 1, counters.key('reports', 'unread'): 1})
         logging.info(f"Report submitted by {user_email}")
 
         return jsonify({'message': 'Report submitted successfully'}), 201
@@ -87,7 +94,49 @@ def get_user_reports():
         logging.error(f"Error fetching user reports: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
-# Route for admins to get all reports
+# Helper function to shape a report for the admin views
+def serialize_report(report):
+    return {
+        'id': str(report['_id']),
+        'user_email': report['user_email'],
+        'subject': report['subject'],
+        'message': report['message'],
+        'reply': report.get('reply', ''),
+        'status': report.get('status', 'unread'),
+        'created_at': report.get('created_at'),
+        'updated_at': report.get('updated_at')
+    }
+
+REPORT_STATUSES = ('unread', 'read', 'replied')
+
+# Build the reports filter from the query string
+# status, user (email or user ID), from/to (created_at range) and q (keywords, served by the text index)
+def build_reports_query(args):
+    status = args.get('status')
+    if status and status not in REPORT_STATUSES:
+        raise ValueError(f"Invalid status: {status}")
+
+    start = parse_datetime_param(args.get('from'))
+    end = parse_datetime_param(args.get('to'), end_of_day=True)
+
+    query = {}
+    if status:
+        query['status'] = status
+    user = args.get('user')
+    if user:
+        if is_valid_objectid(user):
+            query['user_id'] = user
+        else:
+            query['user_email'] = user
+    query.update(date_range_filter('created_at', start, end))
+    keywords = (args.get('q') or '').strip()
+    if keywords:
+        query['$text'] = {'$search': keywords}
+    return query
+
+# Route for admins to get all reports, newest first
+# Query parameters: status, user, from, to, q, limit, after (cursor)
+# Pass ?stream=1 or Accept: application/x-ndjson to stream every matching report as NDJSON
 @reports_bp.route('/admin/reports', methods=['GET'])
 @jwt_required()
 def get_all_reports():
@@ -96,24 +145,33 @@ def get_all_reports():
         if current_user['role'] != 'admin':
             return jsonify({'message': 'Access forbidden'}), 403
 
+        try:
+            query = build_reports_query(request.args)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
         # Access MongoDB
         mongo = current_app.mongo
+        sort = [('created_at', -1), ('_id', -1)]
 
-        reports_cursor = mongo.db.reports.find()
-        reports = []
-        for report in reports_cursor:
-            reports.append({
-                'id': str(report['_id']),
-                'user_email': report['user_email'],
-                'subject': report['subject'],
-                'message': report['message'],
-                'reply': report.get('reply', ''),
-                'status': report.get('status', 'unread'),
-                'created_at': report.get('created_at'),
-                'updated_at': report.get('updated_at')
-            })
+        if wants_stream():
+            return stream_ndjson(mongo.db.reports.find(query).sort(sort), serialize_report)
 
-        return jsonify(reports), 200
+        after = request.args.get('after')
+        if after:
+            try:
+                query.update(keyset_filter('created_at', decode_cursor(after), descending=True))
+            except ValueError:
+                return jsonify({'message': 'Invalid cursor'}), 400
+
+        limit = parse_limit(request.args.get('limit'))
+        documents = list(mongo.db.reports.find(query).sort(sort).limit(limit + 1))
+        page, next_cursor = split_page(documents, limit, ['created_at', '_id'])
+
+        return jsonify({
+            'reports': [serialize_report(report) for report in page],
+            'next_cursor': next_cursor
+        }), 200
 
     except Exception as e:
         logging.error(f"Error fetching all reports: {e}")
@@ -138,12 +196,14 @@ def get_report(report_id):
         if not report:
             return jsonify({'message': 'Report not found'}), 404
 
-        # If the report is unread, mark it as read
+        # If the report is unread, mark it as read (only the request that flips it updates the counters)
         if report['status'] == 'unread':
-            mongo.db.reports.update_one(
-                {'_id': ObjectId(report_id)},
+            result = mongo.db.reports.update_one(
+                {'_id': ObjectId(report_id), 'status': 'unread'},
                 {'$set': {'status': 'read', 'updated_at': datetime.utcnow()}}
             )
+            if result.modified_count:
+                counters.increment(mongo.db, {counters.key('reports', 'unread'): -1, counters.key('reports', 'read'): 1})
             report['status'] = 'read'
 
         report_data = {
@@ -184,15 +244,20 @@ def reply_to_report(report_id):
         # Access MongoDB
         mongo = current_app.mongo
 
-        # Update the report with the reply
-        result = mongo.db.reports.update_one(
+        # Update the report with the reply, keeping the previous status for the counters
+        previous = mongo.db.reports.find_one_and_update(
             {'_id': ObjectId(report_id)},
-            {'$set': {'reply': reply_message, 'status': 'replied', 'updated_at': datetime.utcnow()}}
+            {'$set': {'reply': reply_message, 'status': 'replied', 'updated_at': datetime.utcnow()}},
+            projection={'status': 1}
         )
 
-        if result.matched_count == 0:
+        if previous is None:
             return jsonify({'message': 'Report not found'}), 404
 
+        previous_status = previous.get('status', 'unread')
+        if previous_status != 'replied':
+            counters.increment(mongo.db, {counters.key('reports', previous_status): -1, counters.key('reports', 'replied'): 1})
+
         return jsonify({'message': 'Reply sent successfully'}), 200
 
     except Exception as e:
@@ -3,12 +3,16 @@
 from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_uploads import UploadNotAllowed
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
 from datetime import datetime
 from bson.objectid import ObjectId
-import os
 import json
 
+from services.image_store import ImageTooLarge
+from services import counters
+from services.product_schema import validate_attributes
+
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -32,11 +36,14 @@ def add_product():
         email = current_user['email']
 
         # Check if the user has permission to add products
-        mongo = current_app.mongo
-        user = mongo.db.users.find_one({'email': email})
-        if not user.get('permissions', {}).get('add_product', False):
+        if not current_app.permission_cache.has(current_user, 'add_product'):
             return jsonify({'message': 'Permission denied'}), 403
 
+        mongo = current_app.mongo
+
+        # Refuse oversized uploads before the multipart body is read
+        current_app.image_store.check_request_size()
+
         # Get product data from the request
         name = request.form.get('name')
         description = request.form.get('description')
@@ -50,18 +57,21 @@ def add_product():
 
         # Process attributes
         attributes = json.loads(attributes) if attributes else {}
+        try:
+            attributes = validate_attributes(attributes)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
 
         # Check if the category exists
-        existing_category = mongo.db.categories.find_one({'name': category})
-        if not existing_category:
+        if not current_app.category_cache.exists(category):
             return jsonify({'message': 'Category does not exist'}), 400
 
         # Handle image upload
         image_path = ''
+        image_meta = None
         if image_file:
-            images = current_app.images
-            filename = images.save(image_file)
-            image_path = os.path.join('/uploads/images/', filename)
+            image_meta = current_app.image_store.save(image_file)
+            image_path = image_meta['url']
         elif image_url:
             image_path = image_url
 
@@ -72,23 +82,44 @@ def add_product():
             'category': category,
             'attributes': attributes,
             'image': image_path,
+            'image_meta': image_meta,
             'added_by': email,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
 
+        product['below_min'] = counters.is_low_stock(product)
+
         # Insert into MongoDB
         result = mongo.db.products.insert_one(product)
+        counters.increment(mongo.db, {'products.total': 1, 'products.low_stock': int(product['below_min'])})
+        current_app.product_suggester.record(str(result.inserted_id), name)
+        current_app.versions.bump('products')
         logging.info(f"Product {name} added by {email}")
 
         return jsonify({'message': 'Product added successfully', 'product_id': str(result.inserted_id)}), 201
 
     except UploadNotAllowed:
         return jsonify({'message': 'File type not allowed'}), 400
+    except (ImageTooLarge, RequestEntityTooLarge):
+        return jsonify({'message': 'Image is too large'}), 413
     except Exception as e:
         logging.error(f"Error adding product: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
 
+# Helper function to shape a product for the user's own listing
+def serialize_user_product(product):
+    return {
+        'id': str(product['_id']),
+        'name': product['name'],
+        'description': product['description'],
+        'category': product['category'],
+        'attributes': product.get('attributes', {}),
+        'image': product.get('image', ''),
+        'created_at': product.get('created_at'),
+        'updated_at': product.get('updated_at')
+    }
+
 # Route to get user's products
 @user_products_bp.route('/user/products', methods=['GET'])
 @jwt_required()
@@ -100,20 +131,13 @@ def get_user_products():
         # Access MongoDB
         mongo = current_app.mongo
 
-        # Fetch products added by the user
-        products_cursor = mongo.db.products.find({'added_by': email})
-        products = []
-        for product in products_cursor:
-            products.append({
-                'id': str(product['_id']),
-                'name': product['name'],
-                'description': product['description'],
-                'category': product['category'],
-                'attributes': product.get('attributes', {}),
-                'image': product.get('image', ''),
-                'created_at': product.get('created_at'),
-                'updated_at': product.get('updated_at')
-            })
+        # Fetch products added by the user, from the in-memory mirror when it is loaded
+        mirror = current_app.product_mirror
+        if mirror.fresh():
+            products_cursor = mirror.by_added_by(email)
+        else:
+            products_cursor = mongo.db.products.find({'added_by': email})
+        products = [serialize_user_product(product) for product in products_cursor]
 
         return jsonify(products), 200
 
@@ -130,11 +154,11 @@ def update_user_product(product_id):
         email = current_user['email']
 
         # Check if the user has permission to update products
-        mongo = current_app.mongo
-        user = mongo.db.users.find_one({'email': email})
-        if not user.get('permissions', {}).get('update_product', False):
+        if not current_app.permission_cache.has(current_user, 'update_product'):
             return jsonify({'message': 'Permission denied'}), 403
 
+        mongo = current_app.mongo
+
         if not is_valid_objectid(product_id):
             return jsonify({'message': 'Invalid product ID'}), 400
 
@@ -143,6 +167,9 @@ def update_user_product(product_id):
         if not existing_product:
             return jsonify({'message': 'Product not found or access denied'}), 404
 
+        # Refuse oversized uploads before the multipart body is read
+        current_app.image_store.check_request_size()
+
         # Get update data
         name = request.form.get('name')
         description = request.form.get('description')
@@ -153,6 +180,10 @@ def update_user_product(product_id):
 
         # Process attributes
         attributes = json.loads(attributes) if attributes else {}
+        try:
+            attributes = validate_attributes(attributes)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
 
         # Prepare update fields
         update_fields = {'updated_at': datetime.utcnow()}
@@ -161,21 +192,22 @@ def update_user_product(product_id):
         if description:
             update_fields['description'] = description
         if category:
-            existing_category = mongo.db.categories.find_one({'name': category})
-            if not existing_category:
+            if not current_app.category_cache.exists(category):
                 return jsonify({'message': 'Category does not exist'}), 400
             update_fields['category'] = category
         if attributes:
             update_fields['attributes'] = attributes
+        updated_product = dict(existing_product, attributes=update_fields.get('attributes', existing_product.get('attributes')))
+        update_fields['below_min'] = counters.is_low_stock(updated_product)
 
         # Handle image upload
         if image_file:
-            images = current_app.images
-            filename = images.save(image_file)
-            image_path = os.path.join('/uploads/images/', filename)
-            update_fields['image'] = image_path
+            image_meta = current_app.image_store.save(image_file)
+            update_fields['image'] = image_meta['url']
+            update_fields['image_meta'] = image_meta
         elif image_url:
             update_fields['image'] = image_url
+            update_fields['image_meta'] = None
 
         # Update the product
         result = mongo.db.products.update_one(
@@ -183,11 +215,17 @@ def update_user_product(product_id):
             {'$set': update_fields}
         )
 
+        counters.increment(mongo.db, {'products.low_stock': counters.low_stock_change(existing_product, updated_product)})
+        if name and name != existing_product.get('name'):
+            current_app.product_suggester.record(product_id, name)
+        current_app.versions.bump('products')
         logging.info(f"Product {product_id} updated by {email}")
         return jsonify({'message': 'Product updated successfully'}), 200
 
     except UploadNotAllowed:
         return jsonify({'message': 'File type not allowed'}), 400
+    except (ImageTooLarge, RequestEntityTooLarge):
+        return jsonify({'message': 'Image is too large'}), 413
     except Exception as e:
         logging.error(f"Error updating product: {e}")
         return jsonify({'message': f"Server error: {str(e)}"}), 500
@@ -201,20 +239,27 @@ def delete_user_product(product_id):
         email = current_user['email']
 
         # Check if the user has permission to delete products
-        mongo = current_app.mongo
-        user = mongo.db.users.find_one({'email': email})
-        if not user.get('permissions', {}).get('delete_product', False):
+        if not current_app.permission_cache.has(current_user, 'delete_product'):
             return jsonify({'message': 'Permission denied'}), 403
 
+        mongo = current_app.mongo
+
         if not is_valid_objectid(product_id):
             return jsonify({'message': 'Invalid product ID'}), 400
 
         # Delete the product
-        result = mongo.db.products.delete_one({'_id': ObjectId(product_id), 'added_by': email})
+        deleted = mongo.db.products.find_one_and_delete(
+            {'_id': ObjectId(product_id), 'added_by': email},
+            {'attributes.quantity': 1, 'attributes.min_quantity': 1, 'min_quantity': 1}
+        )
 
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({'message': 'Product not found or access denied'}), 404
 
+        counters.increment(mongo.db, {'products.total': -1, 'products.low_stock': counters.low_stock_change(deleted, None)})
+        current_app.product_suggester.forget(product_id)
+
+        current_app.versions.bump('products')
         logging.info(f"Product {product_id} deleted by {email}")
         return jsonify({'message': 'Product deleted successfully'}), 200
 
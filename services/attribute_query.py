@@ -0,0 +1,101 @@
+# services/attribute_query.py
+
+import math
+import re
+
+from services.product_schema import NUMERIC_ATTRIBUTES
+
+# ============================
+# Attribute Filter Grammar
+# ============================
+# Query parameters over the free-form product attributes map:
+#   attr.<key>=<value>             equality (numbers also match values stored as strings)
+#   attr.<key>__ne=<value>         inequality
+#   attr.<key>__in=<v1>,<v2>,...   any of the values
+#   attr.<key>__gt|gte|lt|lte=<n>  numeric range
+#   order=attr.<key> / -attr.<key> sort ascending / descending, for the numeric attributes only
+# Keys are whitelisted to plain identifiers so a parameter can never reach an operator
+# or another field, and the number of clauses is capped. Every clause compiles to a
+# condition on 'attributes.<key>', which the attributes wildcard index serves. Sorts page
+# on (attributes.<key>, _id), which a wildcard index can't serve, so they are limited to
+# the typed numeric attributes that have their own compound index (services/indexes.py).
+ATTRIBUTE_PREFIX = 'attr.'
+ATTRIBUTE_KEY = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,39}$')
+RANGE_OPERATORS = {'gt': '$gt', 'gte': '$gte', 'lt': '$lt', 'lte': '$lte'}
+MAX_ATTRIBUTE_CLAUSES = 5
+MAX_IN_VALUES = 20
+
+# Helper function to read a query value as a number when it looks like one
+def parse_value(raw):
+    for convert in (int, float):
+        try:
+            value = convert(raw)
+        except ValueError:
+            continue
+        if isinstance(value, float) and not math.isfinite(value):
+            break
+        return value
+    return raw
+
+# Values an equality clause matches: the number and, until attributes are normalized, its string form
+def _equality_values(raw):
+    value = parse_value(raw)
+    return [value] if isinstance(value, str) else [value, raw]
+
+# Helper function to map an attribute key to its document field (raises ValueError)
+def attribute_field(key):
+    if not ATTRIBUTE_KEY.match(key):
+        raise ValueError(f"Invalid attribute: {key}")
+    return f"attributes.{key}"
+
+# Compile the attr.* query parameters of a request into a MongoDB filter (raises ValueError)
+def compile_attribute_filter(args):
+    query = {}
+    clauses = 0
+    for param, raw in args.items(multi=True):
+        if not param.startswith(ATTRIBUTE_PREFIX):
+            continue
+        clauses += 1
+        if clauses > MAX_ATTRIBUTE_CLAUSES:
+            raise ValueError(f"At most {MAX_ATTRIBUTE_CLAUSES} attribute filters are allowed")
+
+        key, _, operator = param[len(ATTRIBUTE_PREFIX):].partition('__')
+        conditions = query.setdefault(attribute_field(key), {})
+        operator = operator or 'eq'
+
+        if operator == 'eq':
+            conditions['$in'] = _equality_values(raw)
+        elif operator == 'ne':
+            conditions['$nin'] = _equality_values(raw)
+        elif operator == 'in':
+            values = [value for value in raw.split(',') if value][:MAX_IN_VALUES + 1]
+            if not values or len(values) > MAX_IN_VALUES:
+                raise ValueError(f"attr.{key}__in takes 1 to {MAX_IN_VALUES} values")
+            conditions['$in'] = [match for value in values for match in _equality_values(value)]
+        elif operator in RANGE_OPERATORS:
+            value = parse_value(raw)
+            if isinstance(value, str):
+                raise ValueError(f"attr.{key}__{operator} must be a number")
+            conditions[RANGE_OPERATORS[operator]] = value
+        else:
+            raise ValueError(f"Invalid attribute operator: {operator}")
+    return query
+
+# Parse an order=attr.<key> / -attr.<key> parameter into (field, descending); None when it isn't one
+# Raises ValueError for attributes that can't be sorted on
+def parse_attribute_order(order):
+    descending = order.startswith('-')
+    name = order[1:] if descending else order
+    if not name.startswith(ATTRIBUTE_PREFIX):
+        return None
+    key = name[len(ATTRIBUTE_PREFIX):]
+    if key not in NUMERIC_ATTRIBUTES:
+        raise ValueError(f"Can only order by {', '.join(f'attr.{key}' for key in NUMERIC_ATTRIBUTES)}")
+    return attribute_field(key), descending
+
+# Restrict a sorted query to documents that have the sort attribute, so the wildcard
+# index (which has no entries for missing fields) can serve the sort
+def require_sort_field(query, field):
+    if field.startswith('attributes.') and field not in query:
+        query[field] = {'$exists': True}
+    return query
@@ -0,0 +1,59 @@
+# services/category_cache.py
+
+import logging
+import threading
+
+# In-process copy of the categories collection.
+# Reads are served from memory; add/delete call invalidate(), which bumps the shared
+# 'categories' version so every other worker reloads on its next version check.
+class CategoryCache:
+    def __init__(self, app=None):
+        self.mongo = None
+        self.versions = None
+        self._names = []
+        self._name_set = frozenset()
+        self._version = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mongo = app.mongo
+        self.versions = app.versions
+        app.category_cache = self
+
+        # Warm the cache at startup; if the database is unreachable it loads on first use
+        try:
+            self.load()
+        except Exception as e:
+            logging.warning(f"Category cache not loaded at startup: {e}")
+
+    # Load all category names together with the version they correspond to
+    def load(self):
+        version = self.versions.get('categories')[0]
+        names = [category['name'] for category in self.mongo.db.categories.find({}, {'name': 1})]
+        with self._lock:
+            self._names = names
+            self._name_set = frozenset(names)
+            self._version = version
+        logging.debug(f"Loaded {len(names)} categories (version {version})")
+
+    # Reload when another worker (or this one) changed the categories
+    def _ensure_current(self):
+        if self._version is None or self._version != self.versions.get('categories')[0]:
+            self.load()
+
+    # Return every category name
+    def names(self):
+        self._ensure_current()
+        return list(self._names)
+
+    # Check whether a category exists
+    def exists(self, name):
+        self._ensure_current()
+        return name in self._name_set
+
+    # Call after any write to the categories collection
+    def invalidate(self):
+        self.versions.bump('categories')
+        self.load()
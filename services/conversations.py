@@ -0,0 +1,139 @@
+# services/conversations.py
+
+import logging
+import click
+from pymongo import UpdateOne
+
+# One summary document per pair of users in the 'conversations' collection:
+#   _id: pair key, participants: [{'id', 'email'}, ...], participant_ids: [id, id],
+#   last_message, last_message_id, last_sender_id, last_timestamp,
+#   unread: {<user id>: count}
+# Messages carry the same pair key in 'pair', indexed with (pair, timestamp, _id).
+# The helpers below are called inside the transactions of the message routes.
+
+# Helper function to build the order-independent key of a conversation
+def pair_key(user_id, other_id):
+    return ':'.join(sorted([user_id, other_id]))
+
+# Record a newly sent message on its conversation
+def record_sent(db, message, message_id, session=None):
+    db.conversations.update_one(
+        {'_id': message['pair']},
+        {
+            '$set': {
+                'last_message': message['message'],
+                'last_message_id': message_id,
+                'last_sender_id': message['sender_id'],
+                'last_timestamp': message['timestamp']
+            },
+            '$inc': {f"unread.{message['receiver_id']}": 1},
+            '$setOnInsert': {
+                'participants': [
+                    {'id': message['sender_id'], 'email': message['sender_email']},
+                    {'id': message['receiver_id'], 'email': message['receiver_email']}
+                ],
+                'participant_ids': sorted([message['sender_id'], message['receiver_id']])
+            }
+        },
+        upsert=True,
+        session=session
+    )
+
+# Record that the receiver has seen one message
+def record_seen(db, message, session=None):
+    if message.get('pair'):
+        db.conversations.update_one(
+            {'_id': message['pair']},
+            {'$inc': {f"unread.{message['receiver_id']}": -1}},
+            session=session
+        )
+
+# Reflect an edit (or a deletion placeholder) in the summary when it is the last message
+def record_text(db, message, text, session=None):
+    if message.get('pair'):
+        db.conversations.update_one(
+            {'_id': message['pair'], 'last_message_id': message['_id']},
+            {'$set': {'last_message': text}},
+            session=session
+        )
+
+# Backfill 'pair' on messages written before conversations existed and rebuild the
+# summaries from them, in batches. Messages written before updated_at existed get their
+# timestamp as updated_at, so the inbox/sent delta sync sees them.
+def backfill(db, batch_size=1000):
+    db.messages.update_many({'updated_at': {'$exists': False}}, [{'$set': {'updated_at': '$timestamp'}}])
+    updated = 0
+    while True:
+        batch = list(db.messages.find({'pair': {'$exists': False}}, {'sender_id': 1, 'receiver_id': 1}).limit(batch_size))
+        if not batch:
+            break
+        db.messages.bulk_write([
+            UpdateOne({'_id': message['_id']}, {'$set': {'pair': pair_key(message['sender_id'], message['receiver_id'])}})
+            for message in batch
+        ], ordered=False)
+        updated += len(batch)
+
+    db.messages.aggregate([
+        {'$sort': {'pair': 1, 'timestamp': 1}},
+        {'$group': {
+            '_id': '$pair',
+            'last': {'$last': '$$ROOT'},
+            'first': {'$first': '$$ROOT'},
+        }},
+        {'$project': {
+            'last_message': '$last.message',
+            'last_message_id': '$last._id',
+            'last_sender_id': '$last.sender_id',
+            'last_timestamp': '$last.timestamp',
+            'participants': [
+                {'id': '$first.sender_id', 'email': '$first.sender_email'},
+                {'id': '$first.receiver_id', 'email': '$first.receiver_email'}
+            ],
+            'participant_ids': [
+                {'$min': ['$first.sender_id', '$first.receiver_id']},
+                {'$max': ['$first.sender_id', '$first.receiver_id']}
+            ]
+        }},
+        {'$merge': {'into': 'conversations', 'whenMatched': 'merge', 'whenNotMatched': 'insert'}}
+    ], allowDiskUse=True)
+
+    # Unread counts per side, from live unseen messages: every side starts at zero, so stale
+    # counts on conversations that are fully read are reset too
+    db.conversations.update_many({}, [{'$set': {'unread': {'$arrayToObject': {'$map': {
+        'input': '$participant_ids', 'as': 'user_id', 'in': {'k': '$$user_id', 'v': 0}
+    }}}}}])
+    for row in db.messages.aggregate([
+        {'$match': {'seen': False, 'deleted': False}},
+        {'$group': {'_id': {'pair': '$pair', 'receiver_id': '$receiver_id'}, 'count': {'$sum': 1}}}
+    ], allowDiskUse=True):
+        db.conversations.update_one(
+            {'_id': row['_id']['pair']},
+            {'$set': {f"unread.{row['_id']['receiver_id']}": row['count']}}
+        )
+    logging.info(f"Backfilled conversation keys on {updated} messages")
+    return updated
+
+# Rebuild every user's unread counter (message_counters, read by /unread_count) from their
+# live unseen messages; counters of users with nothing unread are reset to zero
+def backfill_unread_counters(db):
+    db.message_counters.update_many({}, {'$set': {'unread': 0}})
+    db.messages.aggregate([
+        {'$match': {'seen': False, 'deleted': False}},
+        {'$group': {'_id': '$receiver_id', 'unread': {'$sum': 1}}},
+        {'$merge': {'into': 'message_counters', 'whenMatched': 'merge', 'whenNotMatched': 'insert'}}
+    ], allowDiskUse=True)
+    return db.message_counters.count_documents({'unread': {'$gt': 0}})
+
+# Register the flask CLI commands
+def init_app(app):
+    @app.cli.command('backfill-conversations')
+    def backfill_conversations_command():
+        """Add conversation keys and updated_at to old messages and rebuild conversation summaries."""
+        updated = backfill(app.mongo.db)
+        click.echo(f"Backfilled {updated} messages")
+
+    @app.cli.command('backfill-unread-counters')
+    def backfill_unread_counters_command():
+        """Recount every user's unread messages into message_counters."""
+        users = backfill_unread_counters(app.mongo.db)
+        click.echo(f"Rebuilt unread counters; {users} users have unread messages")
@@ -0,0 +1,121 @@
+# services/counters.py
+
+import logging
+import re
+from datetime import datetime
+import click
+
+from services.scheduler import run_every
+
+# The admin dashboard totals live in a single document of the 'counters' collection:
+#   users.total / users.by_role.<role>, reports.total / reports.by_status.<status>,
+#   orders.total / orders.by_status.<status>, products.total / products.low_stock
+# Write routes keep it current with $inc; reconcile() recounts everything from the
+# collections to repair any drift (run by 'flask reconcile-counters', on a schedule, and
+# at startup when the document is missing or has an older layout).
+DASHBOARD_ID = 'dashboard'
+LAYOUT = 2
+COUNTER_KEY = re.compile(r'^\w{1,40}$')
+
+# The field each group is broken down by, and its value for documents that lack it
+BREAKDOWNS = {
+    'users': ('role', 'user'),
+    'reports': ('status', 'unread'),
+    'orders': ('status', 'pending')
+}
+
+# Counter field for a role/status value, kept apart from the group's totals;
+# anything that isn't a plain word is counted as 'other'
+def key(group, value):
+    value = str(value)
+    return f"{group}.by_{BREAKDOWNS[group][0]}.{value if COUNTER_KEY.match(value) else 'other'}"
+
+# Apply $inc changes such as {'orders.total': 1} to the dashboard counters
+def increment(db, changes, session=None):
+    changes = {field: amount for field, amount in changes.items() if amount}
+    if not changes:
+        return
+    db.counters.update_one(
+        {'_id': DASHBOARD_ID},
+        {'$inc': changes, '$set': {'updated_at': datetime.utcnow()}},
+        upsert=True,
+        session=session
+    )
+
+# Helper function to read a value as an int, whatever type the form stored it as
+def as_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+# Read a product's (quantity, min_quantity) as ints, the way CURRENT_QUANTITY and
+# CURRENT_MIN_QUANTITY do in pipelines (the minimum falls back to the old root field)
+def stock_levels(product):
+    attributes = product.get('attributes') or {}
+    min_quantity = attributes.get('min_quantity')
+    if min_quantity is None:
+        min_quantity = product.get('min_quantity')
+    return as_int(attributes.get('quantity')), as_int(min_quantity)
+
+# Check whether a product is below its minimum quantity
+def is_low_stock(product):
+    if not product:
+        return False
+    quantity, min_quantity = stock_levels(product)
+    return quantity < min_quantity
+
+# Change of the low-stock total when a product goes from `before` to `after` (None = absent)
+def low_stock_change(before, after):
+    return int(is_low_stock(after)) - int(is_low_stock(before))
+
+# Recount every dashboard total from the collections and overwrite the counters document
+def reconcile(db):
+    counters = {
+        'users': {'total': db.users.count_documents({})},
+        'reports': {'total': db.reports.count_documents({})},
+        'orders': {'total': db.orders.count_documents({})},
+        'products': {'total': db.products.count_documents({})}
+    }
+    for collection, (field, default) in BREAKDOWNS.items():
+        breakdown = counters[collection].setdefault(f"by_{field}", {})
+        for row in db[collection].aggregate([{'$group': {'_id': f"${field}", 'count': {'$sum': 1}}}]):
+            value = key(collection, row['_id'] or default).rsplit('.', 1)[1]
+            breakdown[value] = breakdown.get(value, 0) + row['count']
+
+    # Count the stored flag that the write routes keep in step with low_stock_change
+    counters['products']['low_stock'] = db.products.count_documents({'below_min': True})
+
+    db.counters.replace_one(
+        {'_id': DASHBOARD_ID},
+        dict(counters, layout=LAYOUT, updated_at=datetime.utcnow(), reconciled_at=datetime.utcnow()),
+        upsert=True
+    )
+    return counters
+
+# Return the dashboard counters document (a single point read)
+def summary(db):
+    return db.counters.find_one({'_id': DASHBOARD_ID}) or {}
+
+# Reconcile once when the counters document is missing or predates the current layout
+def ensure_counters(db):
+    if summary(db).get('layout') != LAYOUT:
+        logging.info("Dashboard counters missing or outdated, reconciling")
+        reconcile(db)
+
+# Register the flask CLI command, the startup check and the optional periodic reconciliation
+def init_app(app):
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters_command():
+        """Recount the admin dashboard totals from the collections."""
+        counters = reconcile(app.mongo.db)
+        click.echo(f"Reconciled dashboard counters: {counters}")
+
+    try:
+        ensure_counters(app.mongo.db)
+    except Exception as e:
+        logging.error(f"Error checking dashboard counters: {e}")
+
+    interval = app.config.get('COUNTER_RECONCILE_INTERVAL')
+    if interval:
+        run_every(interval, lambda: reconcile(app.mongo.db), 'reconcile-counters')
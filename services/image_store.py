@@ -0,0 +1,304 @@
+# services/image_store.py
+
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import struct
+import tempfile
+import gridfs
+from flask import abort, current_app, make_response, request, send_from_directory
+from flask_uploads import IMAGES, UploadNotAllowed, extension
+from pymongo.errors import DuplicateKeyError
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+# Size of the chunks copied from the upload to disk
+CHUNK_SIZE = 64 * 1024
+
+# Bytes kept from the start of the upload to read the image dimensions from
+HEADER_BYTES = 256 * 1024
+
+# Default maximum size of one image upload (MAX_IMAGE_BYTES)
+DEFAULT_MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+# Stored names look like <sha256>.<ext>; their content can never change
+HASHED_FILENAME = re.compile(r'^([0-9a-f]{64})\.[A-Za-z0-9]+$')
+
+# Accepted upload extensions: raster images only. SVG can carry script, and images are
+# served inline from the app's own origin, so it is not accepted
+IMAGE_EXTENSIONS = tuple(ext for ext in IMAGES if ext != 'svg')
+
+# Raised when an upload exceeds MAX_IMAGE_BYTES
+class ImageTooLarge(Exception):
+    pass
+
+# Helper function to read (width, height) from a PNG, GIF or JPEG header
+def image_dimensions(header):
+    try:
+        if header[:8] == b'\x89PNG\r\n\x1a\n':
+            return struct.unpack('>II', header[16:24])
+        if header[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', header[6:10])
+        if header[:2] == b'\xff\xd8':
+            position = 2
+            while position + 9 < len(header):
+                if header[position] != 0xFF:
+                    position += 1
+                    continue
+                marker = header[position + 1]
+                # SOF0..SOF15 carry the frame size (C4, C8 and CC are not frames)
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>HH', header[position + 5:position + 9])
+                    return width, height
+                segment_length = struct.unpack('>H', header[position + 2:position + 4])[0]
+                position += 2 + segment_length
+    except struct.error:
+        pass
+    return None, None
+
+# Helper function to recognise the image type from its first bytes; None when unknown
+def sniff_content_type(header):
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if header[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[:2] == b'BM':
+        return 'image/bmp'
+    return None
+
+# Helper function to map a stored filename's (whitelisted) extension to its content type
+def extension_content_type(filename):
+    if extension(filename).lower() not in IMAGE_EXTENSIONS:
+        return 'application/octet-stream'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+# Behaviour shared by every image storage backend: validation, the size limit and
+# hashing the upload while it is copied to the backend chunk by chunk
+class ImageStore:
+    url_prefix = '/uploads/images/'
+
+    def __init__(self, app=None):
+        self.max_bytes = DEFAULT_MAX_IMAGE_BYTES
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('MAX_IMAGE_BYTES', DEFAULT_MAX_IMAGE_BYTES)
+
+        # Let Werkzeug reject oversized requests before the multipart body is parsed
+        # (allow some room for the other form fields)
+        app.config.setdefault('MAX_CONTENT_LENGTH', self.max_bytes + 1024 * 1024)
+        app.image_store = self
+
+    # Reject a request whose declared body is larger than an image may be, before
+    # request.files is touched (and the body buffered)
+    def check_request_size(self):
+        if request.content_length and request.content_length > self.max_bytes + 1024 * 1024:
+            raise ImageTooLarge()
+
+    # Helper function to check the upload's extension; returns it lower-cased
+    def _extension(self, file_storage):
+        ext = extension(file_storage.filename or '').lower()
+        if ext not in IMAGE_EXTENSIONS:
+            raise UploadNotAllowed()
+        return ext
+
+    # Copy the upload to write() chunk by chunk; returns (sha256, size, header bytes)
+    def _copy(self, file_storage, write):
+        digest = hashlib.sha256()
+        size = 0
+        header = b''
+        while True:
+            chunk = file_storage.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ImageTooLarge()
+            if len(header) < HEADER_BYTES:
+                header += chunk[:HEADER_BYTES - len(header)]
+            digest.update(chunk)
+            write(chunk)
+        return digest.hexdigest(), size, header
+
+    # Helper function to build the metadata recorded on the product
+    # The content type comes from the bytes, else from the whitelisted extension; the
+    # client-supplied mimetype is never trusted
+    def _metadata(self, filename, sha256, size, header):
+        width, height = image_dimensions(header)
+        content_type = sniff_content_type(header) or extension_content_type(filename)
+        return {
+            'url': self.url_prefix + filename,
+            'filename': filename,
+            'sha256': sha256,
+            'size': size,
+            'width': width,
+            'height': height,
+            'content_type': content_type
+        }
+
+# Content-addressed image store on local disk.
+# Uploads are copied to disk chunk by chunk while being hashed, and stored as
+# <sha256>.<ext>, so re-uploading the same photo reuses the existing file.
+class LocalImageStore(ImageStore):
+    def __init__(self, app=None):
+        self.directory = None
+        self.accel_redirect = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.directory = os.path.abspath(app.config['UPLOADED_IMAGES_DEST'])
+        self.accel_redirect = app.config.get('IMAGE_ACCEL_REDIRECT_PREFIX')
+        os.makedirs(self.directory, exist_ok=True)
+
+    # Save an uploaded FileStorage; returns the image metadata to record on the product
+    def save(self, file_storage):
+        ext = self._extension(file_storage)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                sha256, size, header = self._copy(file_storage, out.write)
+
+            filename = f"{sha256}.{ext}"
+            path = os.path.join(self.directory, filename)
+            if os.path.exists(path):
+                # Same content already stored: keep the existing file
+                os.remove(temp_path)
+                logging.debug(f"Image {filename} already stored, reusing it")
+            else:
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return self._metadata(filename, sha256, size, header)
+
+    # Build the response for a stored image.
+    # With IMAGE_ACCEL_REDIRECT_PREFIX set, the bytes are left to the front proxy
+    # (nginx X-Accel-Redirect); otherwise send_from_directory hands the file to the
+    # server's wsgi.file_wrapper (sendfile), or emits X-Sendfile when USE_X_SENDFILE is on,
+    # and answers Range and If-None-Match requests itself.
+    def send(self, filename):
+        path = safe_join(self.directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        match = HASHED_FILENAME.match(filename)
+        if self.accel_redirect:
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = self.accel_redirect.rstrip('/') + '/' + filename
+            response.mimetype = extension_content_type(filename)
+            return response
+
+        return send_from_directory(
+            self.directory, filename,
+            conditional=True,
+            etag=match.group(1) if match else True
+        )
+
+# Image store in MongoDB GridFS (bucket 'images'), so every app node shares the images
+# without a shared filesystem. Uploads are streamed into GridFS chunks while being hashed;
+# a unique index on metadata.sha256 (see services/indexes.py) deduplicates identical
+# content, and reads stream chunk by chunk with Range support.
+class GridFSImageStore(ImageStore):
+    bucket_name = 'images'
+
+    def __init__(self, app=None):
+        self.mongo = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.mongo = app.mongo
+
+    @property
+    def bucket(self):
+        return gridfs.GridFSBucket(self.mongo.db, bucket_name=self.bucket_name)
+
+    @property
+    def files(self):
+        return self.mongo.db[f"{self.bucket_name}.files"]
+
+    # Save an uploaded FileStorage; returns the image metadata to record on the product
+    def save(self, file_storage):
+        ext = self._extension(file_storage)
+        bucket = self.bucket
+
+        # Upload under a provisional name, then rename once the hash is known
+        grid_in = bucket.open_upload_stream(
+            f"pending/{os.urandom(8).hex()}.{ext}",
+            chunk_size_bytes=255 * 1024
+        )
+        try:
+            sha256, size, header = self._copy(file_storage, grid_in.write)
+        except BaseException:
+            grid_in.abort()
+            raise
+        grid_in.close()
+
+        filename = f"{sha256}.{ext}"
+        existing = self.files.find_one({'metadata.sha256': sha256}, {'filename': 1})
+        if existing:
+            # Same content already stored: drop the new copy and reuse the existing file
+            bucket.delete(grid_in._id)
+            return self._metadata(existing['filename'], sha256, size, header)
+
+        try:
+            self.files.update_one(
+                {'_id': grid_in._id},
+                {'$set': {
+                'filename': filename,
+                'metadata.sha256': sha256,
+                'metadata.content_type': sniff_content_type(header) or extension_content_type(filename)
+            }}
+            )
+        except DuplicateKeyError:
+            # A concurrent upload of the same content won the race
+            bucket.delete(grid_in._id)
+            existing = self.files.find_one({'metadata.sha256': sha256}, {'filename': 1})
+            filename = existing['filename']
+            logging.debug(f"Image {filename} already stored, reusing it")
+
+        return self._metadata(filename, sha256, size, header)
+
+    # Stream a stored image out of GridFS, answering Range and If-None-Match requests
+    def send(self, filename):
+        try:
+            grid_out = self.bucket.open_download_stream_by_name(filename)
+        except gridfs.errors.NoFile:
+            abort(404)
+
+        # Files stored before uploads were sniffed carry the client's mimetype, so the
+        # served type always comes from the whitelisted extension
+        metadata = grid_out.metadata or {}
+        response = current_app.response_class(
+            wrap_file(request.environ, grid_out, buffer_size=CHUNK_SIZE),
+            mimetype=extension_content_type(filename),
+            direct_passthrough=True
+        )
+        response.content_length = grid_out.length
+        response.set_etag(metadata.get('sha256') or str(grid_out._id))
+        response.last_modified = grid_out.upload_date
+        return response.make_conditional(request, accept_ranges=True, complete_length=grid_out.length)
+
+# Image storage backends selectable with IMAGE_STORAGE
+IMAGE_STORES = {
+    'local': LocalImageStore,
+    'gridfs': GridFSImageStore
+}
+
+# Create the configured image store and attach it to the app as app.image_store
+def create_image_store(app):
+    backend = app.config.get('IMAGE_STORAGE', 'local')
+    if backend not in IMAGE_STORES:
+        raise ValueError(f"Unknown IMAGE_STORAGE backend: {backend}")
+    return IMAGE_STORES[backend](app)
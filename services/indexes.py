@@ -0,0 +1,196 @@
+# services/indexes.py
+
+import logging
+from datetime import datetime
+import click
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+from services.retention import DELETED_MESSAGE_TTL_SECONDS
+from services.ledger import EVENTS_COLLECTION, EVENTS_OPTIONS
+from services.product_schema import NUMERIC_ATTRIBUTES
+
+# ============================
+# Collection Registry
+# ============================
+# (collection, options) for collections that must be created explicitly before their first
+# write, such as time-series collections (an insert would create a plain collection instead).
+# ensure_indexes() creates them, so run 'flask ensure-indexes' before deploying code that writes them
+COLLECTIONS = [
+    (EVENTS_COLLECTION, EVENTS_OPTIONS),
+]
+
+# ============================
+# Index Registry
+# ============================
+# (collection, keys, options) for every index the routes rely on
+INDEXES = [
+    ('users', [('email', ASCENDING)], {'unique': True, 'name': 'email_unique'}),
+    ('users', [('role', ASCENDING), ('email', ASCENDING)], {'name': 'role_email'}),
+    ('categories', [('name', ASCENDING)], {'unique': True, 'name': 'name_unique'}),
+    ('products', [('category', ASCENDING), ('_id', ASCENDING)], {'name': 'category_id'}),
+    ('products', [('updated_at', DESCENDING), ('_id', DESCENDING)], {'name': 'updated_at_id'}),
+    ('products', [('added_by', ASCENDING), ('_id', ASCENDING)], {'name': 'added_by_id'}),
+    ('products', [('below_min', ASCENDING), ('_id', ASCENDING)], {
+        'name': 'below_min_id', 'partialFilterExpression': {'below_min': True}
+    }),
+    # Wildcard index over the free-form attributes map, serving the attr.* filters
+    ('products', [('attributes.$**', ASCENDING)], {'name': 'attributes_wildcard'}),
+    # Compound indexes for the attribute sorts, paged on (attribute, _id); one per sortable attribute
+    *[
+        ('products', [(f"attributes.{key}", ASCENDING), ('_id', ASCENDING)], {'name': f"attributes_{key}_id"})
+        for key in NUMERIC_ATTRIBUTES
+    ],
+    ('products', [('name', TEXT), ('description', TEXT), ('category', TEXT)], {
+        'name': 'name_description_category_text', 'weights': {'name': 10, 'category': 5, 'description': 1}
+    }),
+    ('orders', [('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'status_created_at'}),
+    ('orders', [('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'created_at_id'}),
+    ('orders', [('product_id', ASCENDING), ('status', ASCENDING)], {'name': 'product_id_status'}),
+    # At most one open generated reorder per product (see services/reorder.py)
+    ('orders', [('product_id', ASCENDING)], {
+        'unique': True, 'name': 'pending_reorder_unique',
+        'partialFilterExpression': {'status': 'pending', 'source': 'reorder'}
+    }),
+    # The inbox/sent delta sync, over every change including deletions (tombstones)
+    ('messages', [('receiver_email', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)], {
+        'name': 'receiver_email_updated_at'
+    }),
+    ('messages', [('sender_id', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)], {
+        'name': 'sender_id_updated_at'
+    }),
+    ('messages', [('pair', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], {'name': 'pair_timestamp'}),
+    ('messages', [('deleted_at', ASCENDING)], {
+        'name': 'deleted_at_ttl', 'expireAfterSeconds': DELETED_MESSAGE_TTL_SECONDS
+    }),
+    ('messages', [('timestamp', ASCENDING), ('_id', ASCENDING)], {
+        'name': 'live_timestamp', 'partialFilterExpression': {'deleted': False}
+    }),
+    ('messages_archive', [('pair', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], {'name': 'pair_timestamp'}),
+    ('messages_archive', [('sender_id', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], {'name': 'sender_id_timestamp'}),
+    ('messages_archive', [('receiver_id', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], {'name': 'receiver_id_timestamp'}),
+    ('conversations', [('participant_ids', ASCENDING), ('last_timestamp', DESCENDING), ('_id', DESCENDING)], {
+        'name': 'participant_ids_last_timestamp'
+    }),
+    ('reports', [('user_id', ASCENDING), ('created_at', DESCENDING)], {'name': 'user_id_created_at'}),
+    ('reports', [('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'created_at_id'}),
+    ('reports', [('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'status_created_at'}),
+    ('reports', [('user_email', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'user_email_created_at'}),
+    ('reports', [('subject', TEXT), ('message', TEXT)], {
+        'name': 'subject_message_text', 'weights': {'subject': 3, 'message': 1}
+    }),
+    ('inventory_usage_daily', [('product_id', ASCENDING), ('day', ASCENDING)], {'name': 'product_id_day'}),
+    (EVENTS_COLLECTION, [('product_id', ASCENDING), ('timestamp', DESCENDING)], {'name': 'product_id_timestamp'}),
+    ('images.files', [('metadata.sha256', ASCENDING)], {
+        'unique': True, 'name': 'sha256_unique',
+        'partialFilterExpression': {'metadata.sha256': {'$exists': True}}
+    }),
+    ('images.files', [('filename', ASCENDING), ('uploadDate', DESCENDING)], {'name': 'filename_upload_date'}),
+]
+
+# ============================
+# Route Query Plans
+# ============================
+# (name, collection, filter, sort) for the query each route issues; check_indexes()
+# fails when any of them is answered by a collection scan. Unfiltered full reads
+# (cache loads, admin exports) are deliberately not listed.
+QUERY_PLANS = [
+    ('auth.login', 'users', {'email': 'user@example.com'}, None),
+    ('user_chat.get_all_emails', 'users', {'role': 'admin'}, None),
+    ('admin.add_category', 'categories', {'name': 'Seasoning'}, None),
+    ('products.list_products', 'products', {}, [('_id', ASCENDING)]),
+    ('products.list_products[category]', 'products', {'category': 'Seasoning'}, [('_id', ASCENDING)]),
+    ('products.list_products[updated_at]', 'products', {}, [('updated_at', DESCENDING), ('_id', DESCENDING)]),
+    ('products.list_products[attr]', 'products', {'attributes.price': {'$lt': 2}}, None),
+    *[
+        (f"products.list_products[order=attr.{key}]", 'products', {f"attributes.{key}": {'$exists': True}},
+         [(f"attributes.{key}", DESCENDING), ('_id', DESCENDING)])
+        for key in NUMERIC_ATTRIBUTES
+    ],
+    ('inventory.get_low_stock', 'products', {'below_min': True}, [('_id', ASCENDING)]),
+    ('products.search_products', 'products', {'$text': {'$search': 'pepper'}}, None),
+    ('user_products.get_user_products', 'products', {'added_by': 'user@example.com'}, None),
+    ('orders.get_pending_orders', 'orders', {'status': 'pending'}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('orders.reorder_low_stock[pending]', 'orders', {'product_id': {'$in': ['000000000000000000000000']}, 'status': 'pending'}, None),
+    ('orders.get_all_orders', 'orders', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('messages.get_inbox', 'messages', {'receiver_email': 'user@example.com'},
+     [('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    ('messages.get_sent_messages', 'messages', {'sender_id': '000000000000000000000000'},
+     [('updated_at', ASCENDING), ('_id', ASCENDING)]),
+    ('messages.get_conversation', 'messages', {'pair': '000000000000000000000000:000000000000000000000001'},
+     [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('messages.get_conversations', 'conversations', {'participant_ids': '000000000000000000000000'},
+     [('last_timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('retention.archive_messages', 'messages', {'deleted': False, 'timestamp': {'$lt': datetime(2000, 1, 1)}}, None),
+    ('messages.get_archive', 'messages_archive', {'pair': '000000000000000000000000:000000000000000000000001'},
+     [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('reports.get_user_reports', 'reports', {'user_id': '000000000000000000000000'}, None),
+    ('reports.get_all_reports', 'reports', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('reports.get_all_reports[status]', 'reports', {'status': 'unread'}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('reports.get_all_reports[user]', 'reports', {'user_email': 'user@example.com'},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('reports.get_all_reports[q]', 'reports', {'$text': {'$search': 'broken'}}, None),
+    ('inventory.get_usage', 'inventory_usage_daily',
+     {'product_id': {'$in': ['000000000000000000000000']}, 'day': {'$gte': datetime(2000, 1, 1)}},
+     [('product_id', ASCENDING), ('day', ASCENDING)]),
+    ('images.serve_image[gridfs]', 'images.files', {'filename': 'image.png'}, [('uploadDate', DESCENDING)]),
+]
+
+# Create the registered collections that don't exist yet
+def ensure_collections(db):
+    existing = set(db.list_collection_names())
+    for collection, options in COLLECTIONS:
+        if collection not in existing:
+            db.create_collection(collection, **options)
+            logging.info(f"Created collection {collection}")
+
+# Create every registered index (createIndex is a no-op for indexes that already exist)
+def ensure_indexes(db):
+    ensure_collections(db)
+    for collection, keys, options in INDEXES:
+        name = db[collection].create_index(keys, **options)
+        logging.info(f"Ensured index {collection}.{name}")
+
+# Collect every stage name of an explain() plan tree
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+# Explain every route query; returns the names of those whose winning plan is a COLLSCAN
+def check_indexes(db):
+    failures = []
+    for name, collection, query, sort in QUERY_PLANS:
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in set(_plan_stages(winning_plan)):
+            failures.append(name)
+    return failures
+
+# Register the flask CLI commands and optionally build the indexes at startup
+def init_app(app):
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Create every index in the registry."""
+        ensure_indexes(app.mongo.db)
+        click.echo(f"Ensured {len(INDEXES)} indexes")
+
+    @app.cli.command('check-indexes')
+    def check_indexes_command():
+        """Fail when any route query is still answered by a collection scan."""
+        failures = check_indexes(app.mongo.db)
+        if failures:
+            raise click.ClickException(f"COLLSCAN in: {', '.join(failures)}")
+        click.echo(f"All {len(QUERY_PLANS)} route queries are index-served")
+
+    if app.config.get('MONGO_ENSURE_INDEXES', False):
+        try:
+            ensure_indexes(app.mongo.db)
+        except Exception as e:
+            logging.error(f"Error ensuring indexes: {e}")
@@ -0,0 +1,98 @@
+# services/ledger.py
+
+import logging
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+
+# ============================
+# Inventory Ledger
+# ============================
+# Every inventory count and order receipt is recorded twice:
+#   inventory_events       append-only raw events in a time-series collection
+#                          (timeField 'timestamp', metaField 'product_id')
+#   inventory_usage_daily  one bucket per product per UTC day: {product_id, day, used, received, events}
+# Buckets are written with $inc in the same transaction as the inventory update, so usage
+# queries read a few pre-aggregated documents and never scan raw events. Time-series
+# collections can't be written inside a transaction, so raw events are appended right
+# after the update commits.
+EVENTS_COLLECTION = 'inventory_events'
+EVENTS_OPTIONS = {'timeseries': {'timeField': 'timestamp', 'metaField': 'product_id', 'granularity': 'hours'}}
+
+# Build a ledger event; kind is 'count' or 'receipt'
+def event(kind, product_id, by, used=0, received=0, quantity_before=None, quantity=None, order_id=None):
+    entry = {
+        'timestamp': datetime.utcnow(),
+        'product_id': product_id,
+        'type': kind,
+        'used': used,
+        'received': received,
+        'quantity_before': quantity_before,
+        'quantity': quantity,
+        'by': by
+    }
+    if order_id is not None:
+        entry['order_id'] = order_id
+    return entry
+
+# Helper function to truncate a timestamp to its UTC day
+def day_of(timestamp):
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+# Add events to their daily buckets in one bulk write (pass the session to join a transaction)
+def record_buckets(db, events, session=None):
+    if not events:
+        return
+    updates = [
+        UpdateOne(
+            {'_id': f"{entry['product_id']}:{day_of(entry['timestamp']):%Y-%m-%d}"},
+            {
+                '$inc': {'used': entry['used'], 'received': entry['received'], 'events': 1},
+                '$setOnInsert': {'product_id': entry['product_id'], 'day': day_of(entry['timestamp'])}
+            },
+            upsert=True
+        )
+        for entry in events
+    ]
+    db.inventory_usage_daily.bulk_write(updates, ordered=False, session=session)
+
+# Append raw events to the time-series collection (never inside a transaction)
+# A failure here is logged rather than raised: the inventory update and buckets are already committed
+def append_events(db, events):
+    if not events:
+        return
+    try:
+        db[EVENTS_COLLECTION].insert_many(events, ordered=False)
+    except Exception as e:
+        logging.error(f"Error appending {len(events)} inventory ledger events: {e}")
+
+# Daily usage rows for some products between two days (inclusive), oldest first per product
+def daily_usage(db, product_ids, start, end):
+    buckets = db.inventory_usage_daily.find(
+        {'product_id': {'$in': product_ids}, 'day': {'$gte': day_of(start), '$lte': day_of(end)}},
+        {'_id': 0, 'product_id': 1, 'day': 1, 'used': 1, 'received': 1, 'events': 1}
+    ).sort([('product_id', 1), ('day', 1)])
+    return list(buckets)
+
+# Average daily usage per product over the last `days` days, from the buckets
+# Days without a count are included as zero usage, from the product's first bucket on: a
+# product with only a few days of history is averaged over those days, not the whole window
+def average_daily_usage(db, product_ids, days):
+    today = day_of(datetime.utcnow())
+    since = today - timedelta(days=days - 1)
+    pipeline = [
+        {'$match': {'product_id': {'$in': product_ids}, 'day': {'$gte': since}}},
+        {'$group': {'_id': '$product_id', 'used': {'$sum': '$used'}, 'first_day': {'$min': '$day'}}}
+    ]
+    rows = list(db.inventory_usage_daily.aggregate(pipeline))
+
+    # Products whose first bucket in the window is after its start may still have older history
+    late = [row['_id'] for row in rows if row['first_day'] > since]
+    older = set(db.inventory_usage_daily.distinct(
+        'product_id', {'product_id': {'$in': late}, 'day': {'$lt': since}}
+    )) if late else set()
+
+    averages = {}
+    for row in rows:
+        covered = days if row['_id'] in older else (today - row['first_day']).days + 1
+        averages[row['_id']] = row['used'] / covered
+    return averages
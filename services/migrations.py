@@ -0,0 +1,126 @@
+# services/migrations.py
+
+import logging
+from datetime import datetime
+import click
+from pymongo import UpdateOne
+
+from services.product_schema import NUMERIC_ATTRIBUTES, BELOW_MIN_STAGE, to_number
+
+# Each migration records its progress in the 'migrations' collection:
+#   {_id: <name>, last_id, migrated, done, updated_at}
+# Batches are applied in _id order and the checkpoint moves after every batch, so an
+# interrupted run picks up where it stopped and a finished one is a no-op.
+# v2 added target_quantity; re-running over v1-migrated products only touches that field
+INVENTORY_ATTRIBUTES = 'inventory_attributes_v2'
+BELOW_MIN = 'below_min_v1'
+
+# Compute the typed attributes of one product: numbers in 'attributes', none at the root.
+# Values that can't be read (or are negative) are left untouched and reported instead.
+# Returns (update to apply or None when there is nothing to change, list of invalid keys)
+def _inventory_attributes_update(product):
+    attributes = product.get('attributes') or {}
+    fields = {}
+    invalid = []
+    if 'min_quantity' in product:
+        # update_min_quantity used to write the root field; it is the latest explicit value
+        attributes = dict(attributes, min_quantity=product['min_quantity'])
+    for key, kind in NUMERIC_ATTRIBUTES.items():
+        if key not in attributes:
+            continue
+        value = attributes[key]
+        try:
+            typed = to_number(value, kind)
+        except ValueError:
+            invalid.append(key)
+            continue
+        moved = key == 'min_quantity' and 'min_quantity' in product
+        if moved or type(value) is not kind or value != typed:
+            fields[f"attributes.{key}"] = typed
+
+    update = {}
+    if fields:
+        update['$set'] = fields
+    if 'min_quantity' in product and 'min_quantity' not in invalid:
+        update['$unset'] = {'min_quantity': ''}
+    return update or None, invalid
+
+# Normalize the NUMERIC_ATTRIBUTES (quantity, min_quantity, target_quantity, price) to numbers,
+# resuming from the checkpoint. Pass the app's VersionTracker to bump the 'products' version
+# after every batch that changed something, so ETags and the product mirror see the changes.
+# Returns (products migrated, products with values that were left as they are)
+def migrate_inventory_attributes(db, batch_size=500, versions=None):
+    state = db.migrations.find_one({'_id': INVENTORY_ATTRIBUTES}) or {}
+    if state.get('done'):
+        return state.get('migrated', 0), state.get('invalid', 0)
+
+    last_id = state.get('last_id')
+    migrated = state.get('migrated', 0)
+    invalid_products = state.get('invalid', 0)
+    projection = {'attributes': 1, 'min_quantity': 1}
+
+    while True:
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        batch = list(db.products.find(query, projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        updates = []
+        for product in batch:
+            update, invalid = _inventory_attributes_update(product)
+            if invalid:
+                invalid_products += 1
+                logging.warning(f"{INVENTORY_ATTRIBUTES}: product {product['_id']} has invalid {', '.join(invalid)}, left as is")
+            if update:
+                updates.append(UpdateOne({'_id': product['_id']}, update))
+        if updates:
+            db.products.bulk_write(updates, ordered=False)
+            if versions is not None:
+                versions.bump('products')
+
+        last_id = batch[-1]['_id']
+        migrated += len(updates)
+        db.migrations.update_one(
+            {'_id': INVENTORY_ATTRIBUTES},
+            {'$set': {'last_id': last_id, 'migrated': migrated, 'invalid': invalid_products,
+                      'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+        logging.info(f"{INVENTORY_ATTRIBUTES}: {migrated} products migrated (through {last_id})")
+
+    db.migrations.update_one(
+        {'_id': INVENTORY_ATTRIBUTES},
+        {'$set': {'done': True, 'migrated': migrated, 'invalid': invalid_products, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return migrated, invalid_products
+
+# Set the below_min flag on every product, normalizing the attributes it is computed from first
+def backfill_below_min(db, versions=None):
+    migrate_inventory_attributes(db, versions=versions)
+    result = db.products.update_many({}, [BELOW_MIN_STAGE])
+    if result.modified_count and versions is not None:
+        versions.bump('products')
+    db.migrations.update_one(
+        {'_id': BELOW_MIN},
+        {'$set': {'done': True, 'migrated': result.modified_count, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return result.modified_count
+
+# Register the flask CLI commands
+def init_app(app):
+    @app.cli.command('migrate-inventory-attributes')
+    @click.option('--batch-size', default=500, show_default=True, help='Products per batch.')
+    def migrate_inventory_attributes_command(batch_size):
+        """Store inventory quantities, minimums, targets and prices as numbers inside attributes."""
+        migrated, invalid = migrate_inventory_attributes(app.mongo.db, batch_size, app.versions)
+        click.echo(f"Migrated {migrated} products")
+        if invalid:
+            click.echo(f"{invalid} products have values that aren't valid amounts and were left as they are (see the log)")
+
+    @app.cli.command('backfill-below-min')
+    def backfill_below_min_command():
+        """Flag every product whose quantity is below its minimum."""
+        updated = backfill_below_min(app.mongo.db, app.versions)
+        click.echo(f"Updated the below_min flag on {updated} products")
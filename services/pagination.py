@@ -0,0 +1,86 @@
+# services/pagination.py
+
+import base64
+from datetime import datetime, time, timezone
+from bson import json_util
+
+# Default and maximum page sizes for paginated listings
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Helper function to read a bounded page size from the query string
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        limit = int(value)
+    except (ValueError, TypeError):
+        return default
+    return max(1, min(limit, maximum))
+
+# Encode the sort key of the last returned document as an opaque cursor
+def encode_cursor(*values):
+    raw = json_util.dumps(list(values))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+# Decode a cursor produced by encode_cursor (raises ValueError when malformed)
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+# Build the filter that resumes a (field, _id) keyset scan after the cursor values
+def keyset_filter(field, values, descending=False):
+    op = '$lt' if descending else '$gt'
+    if field == '_id':
+        return {'_id': {op: values[0]}}
+    if len(values) != 2:
+        raise ValueError('Invalid cursor')
+    value, last_id = values
+    return {'$or': [
+        {field: {op: value}},
+        {field: value, '_id': {op: last_id}}
+    ]}
+
+# Helper function to read a possibly dotted field (e.g. 'attributes.price') from a document
+def field_value(document, field):
+    for part in field.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+# Split a limit + 1 fetch into the page itself and the cursor for the next page
+def split_page(documents, limit, cursor_fields):
+    has_more = len(documents) > limit
+    page = documents[:limit]
+    next_cursor = None
+    if has_more and page:
+        last = page[-1]
+        next_cursor = encode_cursor(*[field_value(last, field) for field in cursor_fields])
+    return page, next_cursor
+
+# Helper function to parse an ISO-8601 date/datetime query parameter as naive UTC (raises ValueError)
+# Offsets are converted to UTC. With end_of_day, a date-only value means the end of that day,
+# so a 'to' date includes the whole day
+def parse_datetime_param(value, end_of_day=False):
+    if value is None or value == '':
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if end_of_day and 'T' not in value and ' ' not in value.strip():
+        parsed = datetime.combine(parsed.date(), time.max)
+    return parsed
+
+# Build a created_at style range filter from optional 'from' and 'to' query values
+def date_range_filter(field, start, end):
+    bounds = {}
+    if start:
+        bounds['$gte'] = start
+    if end:
+        bounds['$lte'] = end
+    return {field: bounds} if bounds else {}
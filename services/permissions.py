@@ -0,0 +1,57 @@
+# services/permissions.py
+
+import threading
+import time
+
+# Resolves a user's product permissions without a users lookup on every write.
+# Tokens issued at login carry the permissions map and the global 'permissions' version;
+# while that version is current the claims are trusted as-is. Any permission change bumps
+# the version, after which each user is looked up once and cached for a short TTL.
+class PermissionCache:
+    def __init__(self, app=None, ttl=60):
+        self.mongo = None
+        self.versions = None
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mongo = app.mongo
+        self.versions = app.versions
+        self.ttl = app.config.get('PERMISSION_CACHE_TTL', self.ttl)
+        app.permission_cache = self
+
+    # Current permissions version, to be embedded in newly issued tokens
+    def current_version(self):
+        return self.versions.get('permissions')[0]
+
+    # Return the permissions map for a JWT identity
+    def get(self, identity):
+        version = self.current_version()
+        if identity.get('permissions_version') == version and identity.get('permissions') is not None:
+            return identity['permissions']
+
+        email = identity['email']
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+        if entry and entry[0] == version and entry[1] > now:
+            return entry[2]
+
+        user = self.mongo.db.users.find_one({'email': email}, {'permissions': 1})
+        permissions = user.get('permissions', {}) if user else {}
+        with self._lock:
+            self._entries[email] = (version, now + self.ttl, permissions)
+        return permissions
+
+    # Check a single permission (e.g. 'add_product') for a JWT identity
+    def has(self, identity, permission):
+        return bool(self.get(identity).get(permission, False))
+
+    # Call after changing any user's permissions; revokes the claims in issued tokens
+    def invalidate(self):
+        self.versions.bump('permissions')
+        with self._lock:
+            self._entries.clear()
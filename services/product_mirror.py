@@ -0,0 +1,184 @@
+# services/product_mirror.py
+
+import bisect
+import logging
+import threading
+import time
+from pymongo.errors import PyMongoError
+
+# Optional in-process read replica of the products collection (PRODUCT_MIRROR_ENABLED).
+# The whole collection is bulk-loaded at startup and kept current by a background thread
+# tailing a change stream. The thread resumes from the last resume token after transient
+# errors and falls back to a full reload when the token can no longer be resumed.
+# Products are indexed in memory by _id (kept in _id order), category and added_by.
+# The stream also carries the 'products' document of the versions collection. Writers bump
+# it after writing, so once the mirror has applied version N it holds every write before it;
+# fresh() only lets routes answer from the mirror when it has reached the current version.
+class ProductMirror:
+    def __init__(self, app=None):
+        self.mongo = None
+        self.versions = None
+        self.ready = False
+        self._version = None
+        self._by_id = {}
+        self._ids = []
+        self._by_category = {}
+        self._by_added_by = {}
+        self._resume_token = None
+        self._lock = threading.RLock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mongo = app.mongo
+        self.versions = app.versions
+        app.product_mirror = self
+        if app.config.get('PRODUCT_MIRROR_ENABLED', False):
+            self.start()
+
+    # Start the background loader/tailer thread (idempotent)
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='product-mirror', daemon=True)
+            self._thread.start()
+
+    # ============================
+    # Loading and change stream tailing
+    # ============================
+    def _run(self):
+        while True:
+            # Until the stream is (re)opened the mirror may be behind, so nothing reads it
+            self.ready = False
+            try:
+                if self._resume_token is None:
+                    self._full_resync()
+                self._tail()
+            except PyMongoError as e:
+                if getattr(e, 'code', None) in (260, 280, 286):
+                    # Invalid resume token / history lost: the oplog has moved past our position
+                    logging.warning(f"Product mirror cannot resume, resyncing: {e}")
+                    self._resume_token = None
+                else:
+                    logging.error(f"Product mirror change stream error: {e}")
+                time.sleep(1)
+            except Exception as e:
+                logging.error(f"Product mirror error: {e}")
+                self._resume_token = None
+                time.sleep(5)
+
+    # One change stream over the products collection and the versions collection
+    def _watch(self, **kwargs):
+        pipeline = [{'$match': {'ns.coll': {'$in': ['products', 'versions']}}}]
+        return self.mongo.db.watch(pipeline, full_document='updateLookup', **kwargs)
+
+    # Reload every product; the change stream is opened first so no write is missed
+    def _full_resync(self):
+        with self._watch() as stream:
+            # Capture a token for the current position before reading the collection
+            stream.try_next()
+            token = stream.resume_token
+        # Read the version before the products: every write it counts is then in the snapshot
+        version = (self.mongo.db.versions.find_one({'_id': 'products'}) or {}).get('version', 0)
+        products = list(self.mongo.db.products.find())
+        with self._lock:
+            self._by_id = {}
+            self._ids = []
+            self._by_category = {}
+            self._by_added_by = {}
+            for product in products:
+                self._index(product)
+            self._resume_token = token
+            self._version = version
+        logging.info(f"Product mirror loaded {len(products)} products")
+
+    def _tail(self):
+        with self._watch(resume_after=self._resume_token) as stream:
+            self.ready = True
+            for change in stream:
+                self._apply(change)
+                self._resume_token = stream.resume_token
+
+    def _apply(self, change):
+        operation = change['operationType']
+        if change.get('ns', {}).get('coll') == 'versions':
+            if change.get('documentKey', {}).get('_id') != 'products':
+                return
+            # Take the version this event wrote: the looked-up fullDocument of an update is the
+            # document as it is now, which may be ahead of product events not applied yet
+            if operation == 'update':
+                version = change.get('updateDescription', {}).get('updatedFields', {}).get('version')
+            elif operation in ('insert', 'replace'):
+                version = change['fullDocument'].get('version')
+            else:
+                version = None
+            if version is not None:
+                self._version = version
+            return
+        if operation in ('insert', 'update', 'replace'):
+            document = change.get('fullDocument')
+            with self._lock:
+                self._remove(change['documentKey']['_id'])
+                if document is not None:
+                    self._index(document)
+        elif operation == 'delete':
+            with self._lock:
+                self._remove(change['documentKey']['_id'])
+        elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            with self._lock:
+                self._resume_token = None
+                self.ready = False
+            raise RuntimeError(f"products change stream {operation}")
+
+    # ============================
+    # In-memory indexes (callers hold the lock)
+    # ============================
+    def _index(self, product):
+        product_id = product['_id']
+        self._by_id[product_id] = product
+        bisect.insort(self._ids, product_id)
+        bisect.insort(self._by_category.setdefault(product.get('category'), []), product_id)
+        bisect.insort(self._by_added_by.setdefault(product.get('added_by'), []), product_id)
+
+    def _remove(self, product_id):
+        product = self._by_id.pop(product_id, None)
+        if product is None:
+            return
+        for ids in (self._ids,
+                    self._by_category.get(product.get('category'), []),
+                    self._by_added_by.get(product.get('added_by'), [])):
+            position = bisect.bisect_left(ids, product_id)
+            if position < len(ids) and ids[position] == product_id:
+                del ids[position]
+
+    # ============================
+    # Reads
+    # ============================
+    # Whether the mirror is tailing and has applied every change up to the current 'products'
+    # version; routes fall back to MongoDB otherwise
+    def fresh(self):
+        if not self.ready or self._version is None:
+            return False
+        return self._version >= self.versions.get('products')[0]
+
+    # Every product in _id order
+    def all(self):
+        with self._lock:
+            return [self._by_id[product_id] for product_id in self._ids]
+
+    def get(self, product_id):
+        with self._lock:
+            return self._by_id.get(product_id)
+
+    # Products added by one user, in _id order
+    def by_added_by(self, email):
+        with self._lock:
+            return [self._by_id[product_id] for product_id in self._by_added_by.get(email, [])]
+
+    # One page in _id order after an optional _id, optionally restricted to a category.
+    # Returns up to limit + 1 products, like the database listing does
+    def page(self, limit, after=None, category=None):
+        with self._lock:
+            ids = self._by_category.get(category, []) if category else self._ids
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+            return [self._by_id[product_id] for product_id in ids[start:start + limit + 1]]
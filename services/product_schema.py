@@ -0,0 +1,58 @@
+# services/product_schema.py
+
+import math
+
+# Inventory attributes that are stored as numbers, and the type each one is stored as.
+# They live in the product's 'attributes' map (min_quantity included, not at the root).
+NUMERIC_ATTRIBUTES = {
+    'quantity': int,
+    'min_quantity': int,
+    'target_quantity': int,
+    'price': float
+}
+
+# Convert a submitted value to the stored numeric type (raises ValueError)
+# Accepts numbers and numeric strings; ints must be whole, and nothing may be negative
+def to_number(value, kind):
+    if isinstance(value, bool) or value is None:
+        raise ValueError(f"Not a number: {value!r}")
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"Not a number: {value!r}")
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"Not a valid amount: {value!r}")
+    if kind is int:
+        if not number.is_integer():
+            raise ValueError(f"Not a whole number: {value!r}")
+        return int(number)
+    return number
+
+# Validate a submitted attributes map and return it with the numeric attributes typed
+# Raises ValueError naming the offending attribute
+def validate_attributes(attributes):
+    if not isinstance(attributes, dict):
+        raise ValueError('Attributes must be an object')
+    validated = dict(attributes)
+    for key, kind in NUMERIC_ATTRIBUTES.items():
+        if key in validated:
+            try:
+                validated[key] = to_number(validated[key], kind)
+            except ValueError as e:
+                raise ValueError(f"Invalid {key}: {e}")
+    return validated
+
+# Helper function to build a pipeline expression reading a value as an int, whatever type
+# the form stored it as (unreadable or missing values count as 0, like counters.as_int)
+def _as_int(expression):
+    return {'$convert': {'input': expression, 'to': 'int', 'onError': 0, 'onNull': 0}}
+
+# Pipeline expressions for the stored quantity and minimum; the minimum falls back to the
+# root field older products kept it in (see counters.is_low_stock)
+CURRENT_QUANTITY = _as_int('$attributes.quantity')
+CURRENT_MIN_QUANTITY = _as_int({'$ifNull': ['$attributes.min_quantity', '$min_quantity']})
+
+# Pipeline stage recomputing the below_min flag from the stored quantity and minimum.
+# Append it to every pipeline update that changes either of them; /admin/low_stock reads
+# the flag through a partial index instead of comparing the two fields per product.
+BELOW_MIN_STAGE = {'$set': {'below_min': {'$lt': [CURRENT_QUANTITY, CURRENT_MIN_QUANTITY]}}}
@@ -0,0 +1,104 @@
+# services/product_suggest.py
+
+import bisect
+import logging
+import threading
+
+# In-process prefix index over product names for autocomplete.
+# Names are kept in one sorted list of (folded name, name, product id) so a prefix lookup
+# is a bisect plus a short scan. Product writes in this worker update the list in place;
+# they also bump the shared 'product_names' version so other workers reload on their next
+# version check. Stock changes don't touch names, so they don't invalidate the index.
+class ProductSuggester:
+    def __init__(self, app=None):
+        self.mongo = None
+        self.versions = None
+        self._entries = []
+        self._keys = {}
+        self._version = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mongo = app.mongo
+        self.versions = app.versions
+        app.product_suggester = self
+
+        # Warm the index at startup; if the database is unreachable it loads on first use
+        try:
+            self.load()
+        except Exception as e:
+            logging.warning(f"Product suggestions not loaded at startup: {e}")
+
+    # Helper function to build the sort entry of a product name
+    @staticmethod
+    def _entry(product_id, name):
+        return (name.casefold(), name, product_id)
+
+    # Load every product name together with the version it corresponds to
+    def load(self):
+        version = self.versions.get('product_names')[0]
+        entries = [
+            self._entry(str(product['_id']), product['name'])
+            for product in self.mongo.db.products.find({}, {'name': 1})
+            if isinstance(product.get('name'), str)
+        ]
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._keys = {entry[2]: entry for entry in entries}
+            self._version = version
+        logging.debug(f"Loaded {len(entries)} product names (version {version})")
+
+    # Reload when another worker changed product names
+    def _ensure_current(self):
+        if self._version is None or self._version != self.versions.get('product_names')[0]:
+            self.load()
+
+    # Return up to `limit` products whose name starts with `prefix` (case-insensitive)
+    def suggest(self, prefix, limit=10):
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        self._ensure_current()
+        suggestions = []
+        with self._lock:
+            index = bisect.bisect_left(self._entries, (prefix,))
+            while index < len(self._entries) and len(suggestions) < limit:
+                key, name, product_id = self._entries[index]
+                if not key.startswith(prefix):
+                    break
+                suggestions.append({'id': product_id, 'name': name})
+                index += 1
+        return suggestions
+
+    # Helper function to drop a product's entry (call with the lock held)
+    def _remove(self, product_id):
+        entry = self._keys.pop(product_id, None)
+        if entry is not None:
+            index = bisect.bisect_left(self._entries, entry)
+            if index < len(self._entries) and self._entries[index] == entry:
+                del self._entries[index]
+
+    # Publish a local change: adopt the new version only if nothing else changed in between
+    def _advance(self, version):
+        if self._version is not None and self._version == version - 1:
+            self._version = version
+
+    # Call after a product is added or renamed
+    def record(self, product_id, name):
+        version = self.versions.bump('product_names')
+        with self._lock:
+            self._remove(product_id)
+            entry = self._entry(product_id, name)
+            bisect.insort(self._entries, entry)
+            self._keys[product_id] = entry
+            self._advance(version)
+
+    # Call after a product is deleted
+    def forget(self, product_id):
+        version = self.versions.bump('product_names')
+        with self._lock:
+            self._remove(product_id)
+            self._advance(version)
@@ -0,0 +1,113 @@
+# services/reorder.py
+
+import math
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+
+from services import ledger
+from services.product_schema import to_number
+
+# ============================
+# Reorder Engine
+# ============================
+# For every product flagged below_min, order enough to reach its target level plus the
+# usage expected over the cover period:
+#   target = attributes.target_quantity, or min_quantity * REORDER_TARGET_FACTOR
+#   order  = ceil(target + usage per day * REORDER_COVER_DAYS - quantity)
+# Usage per day is the average over the last REORDER_USAGE_DAYS days of ledger buckets,
+# falling back to the last count's used_today for products with no history yet.
+# Products with an open pending order, or whose stock attributes aren't numbers, are
+# skipped. Generated orders carry source='reorder',
+# and a partial unique index allows only one pending generated order per product, so two
+# concurrent runs can't double-order.
+DEFAULT_TARGET_FACTOR = 2
+DEFAULT_COVER_DAYS = 7
+DEFAULT_USAGE_DAYS = 14
+
+# Recent usage per day of each product, from the daily ledger buckets
+def usage_per_day(db, products, days=DEFAULT_USAGE_DAYS):
+    averages = ledger.average_daily_usage(db, [str(product['_id']) for product in products], days)
+    return {
+        product['_id']: averages.get(str(product['_id']), product.get('used_today', 0) or 0)
+        for product in products
+    }
+
+# Compute the reorder suggestion of one product, or None when nothing needs ordering
+# Raises ValueError when a stock attribute can't be read as a number
+def suggest_quantity(product, daily_usage, target_factor, cover_days):
+    attributes = product.get('attributes') or {}
+    quantity = to_number(attributes.get('quantity') or 0, int)
+    min_quantity = to_number(attributes.get('min_quantity') or 0, int)
+    target = attributes.get('target_quantity')
+    target = to_number(target, int) if target else math.ceil(min_quantity * target_factor)
+    order_quantity = math.ceil(max(target, min_quantity) + daily_usage * cover_days - quantity)
+    if order_quantity <= 0:
+        return None
+    return {
+        'product_id': str(product['_id']),
+        'name': product.get('name'),
+        'quantity': quantity,
+        'min_quantity': min_quantity,
+        'target_quantity': target,
+        'usage_per_day': daily_usage,
+        'order_quantity': order_quantity
+    }
+
+# Build the reorder plan: (suggestions, skipped)
+# product_ids optionally restricts the run to some of the below-minimum products
+def plan_reorders(db, target_factor=DEFAULT_TARGET_FACTOR, cover_days=DEFAULT_COVER_DAYS, product_ids=None,
+                  usage_days=DEFAULT_USAGE_DAYS):
+    query = {'below_min': True}
+    if product_ids is not None:
+        query['_id'] = {'$in': product_ids}
+    projection = {'name': 1, 'attributes.quantity': 1, 'attributes.min_quantity': 1,
+                  'attributes.target_quantity': 1, 'used_today': 1}
+    products = list(db.products.find(query, projection).sort('_id', 1))
+    if not products:
+        return [], []
+
+    # One query finds which of them already have an order on the way
+    pending = set(db.orders.distinct('product_id', {
+        'product_id': {'$in': [str(product['_id']) for product in products]},
+        'status': 'pending'
+    }))
+    usage = usage_per_day(db, products, usage_days)
+
+    suggestions, skipped = [], []
+    for product in products:
+        product_id = str(product['_id'])
+        if product_id in pending:
+            skipped.append({'product_id': product_id, 'name': product.get('name'), 'reason': 'pending_order'})
+            continue
+        try:
+            suggestion = suggest_quantity(product, usage.get(product['_id'], 0), target_factor, cover_days)
+        except ValueError:
+            skipped.append({'product_id': product_id, 'name': product.get('name'), 'reason': 'invalid_attributes'})
+            continue
+        if suggestion:
+            suggestions.append(suggestion)
+    return suggestions, skipped
+
+# Create one pending order per suggestion in a single insert_many
+# Returns the suggestions that were ordered; ones that lost a race to another run are dropped
+def create_reorders(db, suggestions, placed_by):
+    if not suggestions:
+        return []
+    now = datetime.utcnow()
+    orders = [{
+        'product_id': suggestion['product_id'],
+        'order_quantity': suggestion['order_quantity'],
+        'status': 'pending',
+        'source': 'reorder',
+        'placed_by': placed_by,
+        'created_at': now
+    } for suggestion in suggestions]
+
+    try:
+        db.orders.insert_many(orders, ordered=False)
+        return suggestions
+    except BulkWriteError as e:
+        duplicates = {error['index'] for error in e.details.get('writeErrors', []) if error.get('code') == 11000}
+        if len(duplicates) != len(e.details.get('writeErrors', [])):
+            raise
+        return [suggestion for index, suggestion in enumerate(suggestions) if index not in duplicates]
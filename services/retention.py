@@ -0,0 +1,126 @@
+# services/retention.py
+
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+from services.scheduler import run_every, acquire_lease, release_lease
+
+# Live messages older than this many days move to messages_archive (MESSAGE_RETENTION_DAYS)
+DEFAULT_RETENTION_DAYS = 90
+
+# Messages moved per insert_many/delete_many round (MESSAGE_ARCHIVE_BATCH_SIZE)
+DEFAULT_BATCH_SIZE = 1000
+
+# Soft-deleted messages are purged by a TTL index on 'deleted_at' after this long
+DELETED_MESSAGE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Only one process archives at a time; the lease is renewed before every batch
+ARCHIVE_LEASE = 'archive-messages'
+ARCHIVE_LEASE_SECONDS = 10 * 60
+
+# Move live messages older than the cutoff from 'messages' into 'messages_archive'.
+# Each batch is copied (replacing any copy left by an interrupted run), then every message is
+# removed only if it is still in the state that was copied: one that was seen, edited or
+# deleted meanwhile stays live, its copy is dropped, and the next run picks it up again.
+# Unread counters are only adjusted for messages that were actually removed, so the job can
+# be re-run safely. Returns the number of messages archived.
+def archive_messages(db, older_than_days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_BATCH_SIZE):
+    owner = acquire_lease(db, ARCHIVE_LEASE, ARCHIVE_LEASE_SECONDS)
+    if owner is None:
+        logging.info("Message archiving is already running elsewhere, skipping")
+        return 0
+
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = 0
+    last_id = None
+    try:
+        while acquire_lease(db, ARCHIVE_LEASE, ARCHIVE_LEASE_SECONDS, owner):
+            query = {'deleted': False, 'timestamp': {'$lt': cutoff}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(db.messages.find(query).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]['_id']
+
+            db.messages_archive.bulk_write([
+                ReplaceOne({'_id': message['_id']}, message, upsert=True) for message in batch
+            ], ordered=False)
+            db.messages.bulk_write([
+                DeleteOne({
+                    '_id': message['_id'],
+                    'deleted': False,
+                    'seen': message.get('seen'),
+                    'updated_at': message.get('updated_at')
+                })
+                for message in batch
+            ], ordered=False)
+
+            ids = [message['_id'] for message in batch]
+            kept = set(db.messages.distinct('_id', {'_id': {'$in': ids}}))
+            if kept:
+                db.messages_archive.delete_many({'_id': {'$in': list(kept)}})
+            removed = [message for message in batch if message['_id'] not in kept]
+            _uncount_unseen(db, removed)
+            archived += len(removed)
+            logging.info(f"Archived {archived} messages so far")
+    finally:
+        release_lease(db, ARCHIVE_LEASE, owner)
+    return archived
+
+# Archived messages leave the inbox, so take unseen ones off the unread counters
+def _uncount_unseen(db, batch):
+    unseen = [message for message in batch if not message.get('seen', False)]
+    if not unseen:
+        return
+    per_user = Counter(message['receiver_id'] for message in unseen)
+    db.message_counters.bulk_write([
+        UpdateOne({'_id': user_id}, {'$inc': {'unread': -count}})
+        for user_id, count in per_user.items()
+    ], ordered=False)
+    per_pair = Counter((message['pair'], message['receiver_id']) for message in unseen if message.get('pair'))
+    if per_pair:
+        db.conversations.bulk_write([
+            UpdateOne({'_id': pair}, {'$inc': {f"unread.{user_id}": -count}})
+            for (pair, user_id), count in per_pair.items()
+        ], ordered=False)
+
+# Stamp deleted_at on messages soft-deleted before it was recorded, so the TTL index
+# purges them too. They get the current time, i.e. the full grace period from now.
+# Returns the number of messages stamped
+def backfill_deleted_at(db):
+    result = db.messages.update_many(
+        {'deleted': True, 'deleted_at': {'$exists': False}},
+        {'$currentDate': {'deleted_at': True}}
+    )
+    return result.modified_count
+
+# Register the flask CLI commands (for cron) and the optional in-process schedule
+def init_app(app):
+    @app.cli.command('archive-messages')
+    @click.option('--days', type=int, default=None, help='Archive messages older than this many days.')
+    def archive_messages_command(days):
+        """Move old messages into messages_archive."""
+        archived = archive_messages(
+            app.mongo.db,
+            days if days is not None else app.config.get('MESSAGE_RETENTION_DAYS', DEFAULT_RETENTION_DAYS),
+            app.config.get('MESSAGE_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        )
+        click.echo(f"Archived {archived} messages")
+
+    @app.cli.command('backfill-deleted-at')
+    def backfill_deleted_at_command():
+        """Stamp deleted_at on old soft-deleted messages so they expire."""
+        stamped = backfill_deleted_at(app.mongo.db)
+        click.echo(f"Stamped deleted_at on {stamped} messages")
+
+    interval = app.config.get('MESSAGE_ARCHIVE_INTERVAL')
+    if interval:
+        run_every(interval, lambda: archive_messages(
+            app.mongo.db,
+            app.config.get('MESSAGE_RETENTION_DAYS', DEFAULT_RETENTION_DAYS),
+            app.config.get('MESSAGE_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        ), 'archive-messages')
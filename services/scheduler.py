@@ -0,0 +1,46 @@
+# services/scheduler.py
+
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+# Run job() every interval seconds in a daemon background thread.
+# Meant for idempotent maintenance jobs; each worker process runs its own schedule, so jobs
+# that must not overlap across workers also take a lease (acquire_lease below).
+def run_every(interval, job, name):
+    def run():
+        try:
+            job()
+        except Exception as e:
+            logging.error(f"Error running {name}: {e}")
+        schedule()
+
+    def schedule():
+        timer = threading.Timer(interval, run)
+        timer.name = name
+        timer.daemon = True
+        timer.start()
+
+    schedule()
+
+# Take or renew the named lease in the 'leases' collection for `seconds`.
+# Returns the owner token (pass it back to renew and release), or None while someone else holds it
+def acquire_lease(db, name, seconds, owner=None):
+    owner = owner or uuid.uuid4().hex
+    now = datetime.utcnow()
+    try:
+        db.leases.update_one(
+            {'_id': name, '$or': [{'expires_at': {'$lte': now}}, {'owner': owner}]},
+            {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease document exists and is held by another owner
+        return None
+    return owner
+
+# Give up a lease taken with acquire_lease
+def release_lease(db, name, owner):
+    db.leases.delete_one({'_id': name, 'owner': owner})
@@ -0,0 +1,40 @@
+# services/streaming.py
+
+from flask import Response, current_app, json, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Flush encoded rows to the client once roughly this many bytes are buffered
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Check whether the client opted into streaming (?stream=1 or Accept: application/x-ndjson)
+def wants_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+# Stream a pymongo cursor as newline-delimited JSON, one serialized document per line.
+# Documents are pulled from MongoDB batch_size at a time, so memory stays flat and the
+# first rows reach the client while later batches are still being fetched.
+def stream_ndjson(cursor, serialize, batch_size=None):
+    cursor = cursor.batch_size(batch_size or current_app.config.get('STREAM_BATCH_SIZE', 500))
+
+    def generate():
+        try:
+            buffer = []
+            buffered = 0
+            for document in cursor:
+                line = json.dumps(serialize(document)) + '\n'
+                buffer.append(line)
+                buffered += len(line)
+                if buffered >= STREAM_CHUNK_BYTES:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffered = 0
+            if buffer:
+                yield ''.join(buffer)
+        finally:
+            cursor.close()
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,55 @@
+# services/versions.py
+
+import logging
+import threading
+import time
+from datetime import datetime
+from pymongo import ReturnDocument
+
+# Tracks a change version per named dataset (e.g. 'categories') in the 'versions' collection.
+# Every worker process keeps the versions in memory and re-reads them at most once per
+# check interval, so other processes see a bump within that interval.
+class VersionTracker:
+    def __init__(self, app=None, check_interval=5):
+        self.mongo = None
+        self.check_interval = check_interval
+        self._versions = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mongo = app.mongo
+        self.check_interval = app.config.get('VERSION_CHECK_INTERVAL', self.check_interval)
+        app.versions = self
+
+    # Re-read every version document (the collection holds one small document per dataset)
+    def _refresh(self):
+        try:
+            self._versions = {
+                doc['_id']: (doc.get('version', 0), doc.get('updated_at'))
+                for doc in self.mongo.db.versions.find({})
+            }
+        except Exception as e:
+            logging.error(f"Error refreshing versions: {e}")
+        self._checked_at = time.monotonic()
+
+    # Return (version, updated_at) for a dataset, refreshing when the cached copy is stale
+    def get(self, name):
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                self._refresh()
+            return self._versions.get(name, (0, None))
+
+    # Record a change to a dataset and return its new version
+    def bump(self, name):
+        doc = self.mongo.db.versions.find_one_and_update(
+            {'_id': name},
+            {'$inc': {'version': 1}, '$set': {'updated_at': datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            self._versions[name] = (doc['version'], doc['updated_at'])
+        return doc['version']